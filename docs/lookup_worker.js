@@ -0,0 +1,52 @@
+// Web Worker that loads the binary lookup table and converts postcodes in
+// batches off the main thread.
+//
+// Messages in:
+//   {type: "load", url: "pcon_2024.bin"}
+//   {type: "convert", id: 1, postcodes: [...]}
+//     a newer convert supersedes an older one, which stops without a result
+// Messages out:
+//   {type: "loaded"}
+//   {type: "progress", id: 1, done: 10000, total: 100000}
+//   {type: "result", id: 1, values: [...]}
+//   {type: "error", message: "..."}
+
+importScripts("mini_lookup.js");
+
+let lookup = null;
+let latestId = null;
+const chunkSize = 10000;
+
+// let queued messages (e.g. a newer convert) run between chunks
+const yieldToMessages = () => new Promise((resolve) => setTimeout(resolve, 0));
+
+self.onmessage = async (event) => {
+    const message = event.data;
+    try {
+        if (message.type === "load") {
+            lookup = await PostcodeRangeLookup.fromBinaryUrl(message.url);
+            self.postMessage({ type: "loaded" });
+        } else if (message.type === "convert") {
+            if (lookup === null) {
+                throw new Error("Lookup table not loaded");
+            }
+            latestId = message.id;
+            const postcodes = message.postcodes;
+            const values = new Array(postcodes.length);
+            for (let start = 0; start < postcodes.length; start += chunkSize) {
+                const end = Math.min(start + chunkSize, postcodes.length);
+                for (let i = start; i < end; i++) {
+                    values[i] = lookup.getValue(postcodes[i]);
+                }
+                self.postMessage({ type: "progress", id: message.id, done: end, total: postcodes.length });
+                await yieldToMessages();
+                if (latestId !== message.id) {
+                    return;
+                }
+            }
+            self.postMessage({ type: "result", id: message.id, values: values });
+        }
+    } catch (error) {
+        self.postMessage({ type: "error", message: String(error) });
+    }
+};
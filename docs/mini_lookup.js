@@ -24,25 +24,84 @@ class StoredData {
 }
 
 const reverseDifferenceCompression = (listA) => {
-    let result = [];
+    const result = new Float64Array(listA.length);
     let lastValue = 0;
-    for (let value of listA) {
-        lastValue += value;
-        result.push(lastValue);
+    for (let i = 0; i < listA.length; i++) {
+        lastValue += listA[i];
+        result[i] = lastValue;
     }
     return result;
 };
 
 const reverseDropMinusOne = (listA) => {
-    let result = listA.slice(0, 2);
-    for (let value of listA.slice(2)) {
-        if (value === 0) {
-            result.push(result[result.length - 2]);
+    const result = new Uint32Array(listA.length);
+    for (let i = 0; i < listA.length; i++) {
+        const value = listA[i];
+        // zero means 'same as two back', already stored zero indexed
+        result[i] = (value === 0 && i >= 2) ? result[i - 2] : value - 1;
+    }
+    return result;
+};
+
+const binaryMagic = "MPLB";
+const binaryVersion = 1;
+
+const typedArrayForDtype = {
+    "|u1": Uint8Array,
+    "<f8": Float64Array,
+    "<u4": Uint32Array,
+    "<i4": Int32Array,
+};
+
+// Decode a Uint8Array of LEB128 varints (7 bits a byte, high bit set when
+// more bytes follow) into a Float64Array of length count.
+// Uses multiplication rather than bit shifts as values can exceed 32 bits.
+const decodeVarints = (bytes, count) => {
+    const result = new Float64Array(count);
+    let index = 0;
+    let value = 0;
+    let multiplier = 1;
+    for (let i = 0; i < bytes.length; i++) {
+        const byte = bytes[i];
+        value += (byte & 0x7f) * multiplier;
+        if (byte & 0x80) {
+            multiplier *= 128;
         } else {
-            result.push(value);
+            result[index++] = value;
+            value = 0;
+            multiplier = 1;
+        }
+    }
+    return result;
+};
+
+// Decode the binary container written by mini_postcode_lookup.binary
+// Returns typed array views over the buffer (no copying) and the metadata
+const decodeBinary = (buffer) => {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== binaryMagic) {
+        throw new Error("Not a mini postcode lookup binary file");
+    }
+    const version = view.getUint32(4, true);
+    if (version !== binaryVersion) {
+        throw new Error(`Unsupported binary format version: ${version}`);
+    }
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(
+        new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength))
+    );
+    const dataStart = 12 + headerLength;
+
+    const arrays = {};
+    for (const [name, details] of Object.entries(header.arrays)) {
+        const ArrayType = typedArrayForDtype[details.dtype];
+        if (ArrayType === undefined) {
+            throw new Error(`Unsupported dtype: ${details.dtype}`);
         }
+        arrays[name] = new ArrayType(buffer, dataStart + details.offset, details.length);
     }
-    return result.map(x => x - 1);
+    return { arrays: arrays, meta: header.meta };
 };
 
 const postcodeToInt = (postcode) => {
@@ -88,6 +147,22 @@ class PostcodeRangeLookup {
         }
     }
 
+    // Convert a list of postcodes in chunks, calling onProgress(done, total)
+    // after each chunk
+    getValues(postcodes, onProgress = null, chunkSize = 10000) {
+        const result = new Array(postcodes.length);
+        for (let start = 0; start < postcodes.length; start += chunkSize) {
+            const end = Math.min(start + chunkSize, postcodes.length);
+            for (let i = start; i < end; i++) {
+                result[i] = this.getValue(postcodes[i]);
+            }
+            if (onProgress !== null) {
+                onProgress(end, postcodes.length);
+            }
+        }
+        return result;
+    }
+
     static fromDict(data) {
         return new PostcodeRangeLookup(
             reverseDifferenceCompression(data.postcode_keys),
@@ -101,5 +176,32 @@ class PostcodeRangeLookup {
         const data = await response.json();
         return PostcodeRangeLookup.fromDict(data);
     }
+
+    // keys and values are stored compressed as in fromDict, as varint streams
+    static fromBinary(buffer) {
+        const { arrays, meta } = decodeBinary(buffer);
+        return new PostcodeRangeLookup(
+            reverseDifferenceCompression(decodeVarints(arrays.postcode_keys, meta.count)),
+            reverseDropMinusOne(decodeVarints(arrays.value_key, meta.count)),
+            meta.value_values
+        );
+    }
+
+    static async fromBinaryUrl(path) {
+        const response = await fetch(path);
+        const buffer = await response.arrayBuffer();
+        return PostcodeRangeLookup.fromBinary(buffer);
+    }
+}
+
+// allow use from node (for tests) as well as the browser and workers
+if (typeof module !== "undefined" && module.exports) {
+    module.exports = {
+        PostcodeRangeLookup,
+        checkRealPostcode,
+        decodeBinary,
+        decodeVarints,
+        postcodeToInt,
+    };
 }
 
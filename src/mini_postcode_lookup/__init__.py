@@ -2,7 +2,30 @@
 Approach for small lookup files for postcode geographies.
 """
 
-from .process import AllowedAreaTypes, MiniPostcodeLookup, PostcodeRangeLookup
+from typing import TYPE_CHECKING, Any
 
-__all__ = ["MiniPostcodeLookup", "AllowedAreaTypes", "PostcodeRangeLookup"]
+if TYPE_CHECKING:
+    from .process import (
+        AllowedAreaTypes,
+        MiniPostcodeLookup,
+        NestedAreaTypes,
+        PostcodeRangeLookup,
+    )
+
+__all__ = [
+    "MiniPostcodeLookup",
+    "AllowedAreaTypes",
+    "NestedAreaTypes",
+    "PostcodeRangeLookup",
+]
 __version__ = "0.1.0"
+
+
+def __getattr__(name: str) -> Any:
+    # imported on first use, so the command line client can
+    # talk to the lookup server without importing pandas
+    if name in __all__:
+        from . import process
+
+        return getattr(process, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,149 @@
+"""
+Simple container format for storing numeric arrays on disk.
+
+Layout (all little-endian):
+
+- 4 bytes magic (``MPLB``)
+- uint32 format version
+- uint32 length of the JSON header
+- JSON header, padded with spaces to an 8 byte boundary
+- array data, each array starting on an 8 byte boundary
+
+The header holds the dtype, offset and length of each array plus any
+extra metadata (e.g. the list of value labels). This is simple enough to
+read from the browser with an ArrayBuffer and typed array views, and from
+Python with a memory map.
+
+Lists of integers can be stored compactly as a uint8 stream of
+LEB128 varints (varint_encode / varint_decode).
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+MAGIC = b"MPLB"
+VERSION = 1
+ALIGNMENT = 8
+
+
+def _pad(length: int) -> int:
+    return (ALIGNMENT - length % ALIGNMENT) % ALIGNMENT
+
+
+def write_arrays(
+    path: Path, arrays: dict[str, np.ndarray[Any, Any]], meta: dict[str, Any]
+):
+    """
+    Write a dictionary of 1d numpy arrays and a metadata dict to path
+    """
+    offset = 0
+    array_header: dict[str, dict[str, Any]] = {}
+    blobs: list[bytes] = []
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        if values.dtype.byteorder == ">":
+            values = values.astype(values.dtype.newbyteorder("<"))
+        blob = values.tobytes()
+        array_header[name] = {
+            "dtype": values.dtype.str,
+            "offset": offset,
+            "length": len(values),
+        }
+        blob += b"\x00" * _pad(len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps(
+        {"arrays": array_header, "meta": meta}, separators=(",", ":"), allow_nan=False
+    ).encode("utf-8")
+    # 12 bytes of preamble, then the header, then padding to align the data
+    header += b" " * _pad(12 + len(header))
+
+    with path.open("wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", VERSION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+
+
+def read_arrays(
+    path: Path, *, mmap: bool = True
+) -> tuple[dict[str, np.ndarray[Any, Any]], dict[str, Any]]:
+    """
+    Read arrays written by write_arrays.
+    If mmap is True, the arrays are read-only views over a memory map
+    rather than being loaded into memory.
+    """
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+    return decode_arrays(buffer)
+
+
+def decode_arrays(
+    buffer: np.ndarray[Any, Any],
+) -> tuple[dict[str, np.ndarray[Any, Any]], dict[str, Any]]:
+    """
+    Decode arrays from a uint8 buffer in the write_arrays format
+    """
+    if bytes(buffer[:4]) != MAGIC:
+        raise ValueError("Not a mini postcode lookup binary file")
+    version, header_length = struct.unpack("<II", bytes(buffer[4:12]))
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary format version: {version}")
+    header = json.loads(bytes(buffer[12 : 12 + header_length]).decode("utf-8"))
+    data_start = 12 + header_length
+
+    arrays: dict[str, np.ndarray[Any, Any]] = {}
+    for name, details in header["arrays"].items():
+        dtype = np.dtype(details["dtype"])
+        start = data_start + details["offset"]
+        end = start + dtype.itemsize * details["length"]
+        arrays[name] = buffer[start:end].view(dtype)
+    return arrays, header["meta"]
+
+
+def varint_encode(values: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    """
+    Encode non-negative integers as LEB128 varints
+    (7 bits per byte, high bit set when more bytes follow)
+    """
+    values = values.astype(np.uint64)
+    byte_count = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        byte_count += remaining > 0
+        remaining >>= np.uint64(7)
+
+    max_bytes = int(byte_count.max()) if len(values) else 1
+    position = np.arange(max_bytes)
+    shifted = values[:, None] >> (np.uint64(7) * position.astype(np.uint64))
+    encoded = (shifted & np.uint64(0x7F)).astype(np.uint8)
+    encoded[position < (byte_count[:, None] - 1)] |= 0x80
+    return encoded[position < byte_count[:, None]]
+
+
+def varint_decode(stream: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    """
+    Decode a stream of LEB128 varints into an int64 array
+    """
+    ends = (stream & 0x80) == 0
+    # which varint each byte belongs to, and its position in that varint
+    varint_id = np.cumsum(ends) - ends
+    varint_starts = np.concatenate([[0], np.flatnonzero(ends)[:-1] + 1])
+    byte_position = np.arange(len(stream)) - varint_starts[varint_id]
+    values = np.zeros(int(ends.sum()), dtype=np.int64)
+    np.add.at(
+        values,
+        varint_id,
+        (stream & 0x7F).astype(np.int64) << (7 * byte_position),
+    )
+    return values
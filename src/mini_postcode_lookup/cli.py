@@ -0,0 +1,227 @@
+import json
+import signal
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import Optional
+
+import typer
+from trogon.typer import init_tui  # type: ignore
+
+from .client import LookupClient, default_socket_path
+from .process import (
+    AllowedAreaTypes,
+    FileFormat,
+    IMDInclude,
+    IMDNation,
+    MiniPostcodeLookup,
+    lookup_values,
+)
+from .util import StrEnum
+
+app = typer.Typer(help="")
+
+init_tui(app)
+
+
+class StreamFormat(StrEnum):
+    TSV = "tsv"
+    NDJSON = "ndjson"
+
+
+@app.command()
+def get_postcode(
+    postcode: str,
+    area_type: AllowedAreaTypes = AllowedAreaTypes.PCON_2024,
+    reject_unknown: bool = False,
+    use_daemon: bool = True,
+):
+    """
+    Get the ID for an area type
+    """
+    client = LookupClient.connect() if use_daemon else None
+    if client is not None:
+        try:
+            with client:
+                values = client.get_values([postcode], [area_type], reject_unknown)
+        except OSError:
+            # server stopped or timed out, so look up locally
+            pass
+        else:
+            typer.echo(values[str(area_type)][0])
+            return
+    lookup = MiniPostcodeLookup(reject_unknown=reject_unknown)
+    typer.echo(lookup.get_value(postcode, area_type=area_type))
+
+
+@app.command()
+def stream(
+    area_type: list[AllowedAreaTypes] = typer.Option([AllowedAreaTypes.PCON_2024]),
+    output_format: StreamFormat = StreamFormat.TSV,
+    header: bool = True,
+    batch_size: int = 10_000,
+    reject_unknown: bool = False,
+    use_daemon: bool = True,
+):
+    """
+    Read postcodes (one per line) from stdin and write their areas to stdout
+    """
+    client = LookupClient.connect() if use_daemon else None
+    lookup = MiniPostcodeLookup() if client is None else None
+
+    if header and output_format == StreamFormat.TSV:
+        typer.echo("\t".join(["postcode"] + [str(x) for x in area_type]))
+
+    lines = (line.rstrip("\r\n") for line in sys.stdin)
+    while batch := list(islice(lines, batch_size)):
+        values = None
+        if client is not None:
+            try:
+                values = client.get_values(batch, area_type, reject_unknown)
+            except OSError:
+                # server stopped or timed out, so carry on locally
+                client.close()
+                client = None
+                lookup = MiniPostcodeLookup()
+        if values is None:
+            values = lookup_values(lookup, batch, area_type, reject_unknown)  # type: ignore
+        rows = zip(batch, *[values[str(x)] for x in area_type])
+        if output_format == StreamFormat.TSV:
+            output = ["\t".join("" if x is None else x for x in row) for row in rows]
+        else:
+            keys = ["postcode"] + [str(x) for x in area_type]
+            output = [json.dumps(dict(zip(keys, row))) for row in rows]
+        sys.stdout.write("\n".join(output) + "\n")
+        sys.stdout.flush()
+
+    if client is not None:
+        client.close()
+
+
+@app.command()
+def serve(
+    socket_path: Optional[Path] = None,
+    preload: list[AllowedAreaTypes] = typer.Option([AllowedAreaTypes.PCON_2024]),
+):
+    """
+    Run a lookup server with the tables loaded.
+    get-postcode and stream use it automatically while it is running.
+    """
+    if socket_path is None:
+        socket_path = default_socket_path()
+    if socket_path is None:
+        typer.echo("The lookup server needs Unix domain sockets, not available here")
+        raise typer.Exit(1)
+
+    from . import daemon
+
+    # exit cleanly (removing the socket) when stopped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    typer.echo(f"Serving lookups at {socket_path}")
+    try:
+        daemon.serve(socket_path, preload=preload)
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command()
+def reverse_geocode(
+    latitude: float,
+    longitude: float,
+    area_type: list[AllowedAreaTypes] = typer.Option([AllowedAreaTypes.PCON_2024]),
+    max_distance: float = 10_000,
+):
+    """
+    Get the nearest postcode (and its areas) to a point
+    """
+    lookup = MiniPostcodeLookup()
+    df = lookup.nearest_postcodes(
+        [latitude], [longitude], area_types=area_type, max_distance=max_distance
+    )
+    row = df.iloc[0]
+    if row["postcode"] is None:
+        typer.echo(f"No postcode within {max_distance:g}m")
+        raise typer.Exit(1)
+    typer.echo(f"{row['postcode']} ({row['distance']:.0f}m)")
+    for item in area_type:
+        typer.echo(f"{item}: {row[str(item)]}")
+
+
+@app.command()
+def add_to_csv(
+    file_loc: str,
+    area_type: AllowedAreaTypes = AllowedAreaTypes.PCON_2024,
+    postcode_col: str = "postcode",
+    include_extra_cols: bool = False,
+    include_imd: IMDInclude = IMDInclude.NONE,
+    imd_nation: IMDNation = IMDNation.E,
+    remove_postcode: bool = False,
+):
+    """
+    Add a column to a csv with the area type
+    """
+    add_to_file(
+        file_loc,
+        area_type=area_type,
+        postcode_col=postcode_col,
+        include_extra_cols=include_extra_cols,
+        include_imd=include_imd,
+        imd_nation=imd_nation,
+        remove_postcode=remove_postcode,
+        file_format=FileFormat.CSV,
+    )
+
+
+@app.command()
+def add_to_file(
+    file_loc: str,
+    area_type: AllowedAreaTypes = AllowedAreaTypes.PCON_2024,
+    postcode_col: str = "postcode",
+    include_extra_cols: bool = False,
+    include_imd: IMDInclude = IMDInclude.NONE,
+    imd_nation: IMDNation = IMDNation.E,
+    remove_postcode: bool = False,
+    file_format: Optional[FileFormat] = None,
+    reject_unknown: bool = False,
+):
+    """
+    Add a column to a csv, parquet or feather file with the area type
+    """
+
+    if include_imd != IMDInclude.NONE and area_type != AllowedAreaTypes.LSOA:
+        raise ValueError("IMD can only be included for LSOA")
+
+    lookup = MiniPostcodeLookup(reject_unknown=reject_unknown)
+    lookup.add_to_file(
+        Path(file_loc),
+        area_type=area_type,
+        postcode_col=postcode_col,
+        include_extra_cols=include_extra_cols,
+        include_imd=include_imd,
+        imd_nation=imd_nation,
+        remove_postcode=remove_postcode,
+        file_format=file_format,
+    )
+
+
+@app.command()
+def generate_lookups(force: bool = False, verify: bool = False):
+    """
+    Refresh the lookup tables from source.
+    With --verify, check every postcode in the sources against the tables.
+    """
+    from .extra_values import make_extra_values
+    from .generate import generate
+    from .generate import verify as verify_lookups
+    from .get_latest_onspd import get_onspd_if_not_present
+
+    get_onspd_if_not_present()
+    generate(force=force)
+    make_extra_values(force=force)
+
+    if verify and not verify_lookups():
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,188 @@
+"""
+Client for the lookup server (see daemon.py), and the command line entry point.
+
+This only uses the standard library, so `get-postcode` can be answered by a
+running server without importing pandas or the full command line app.
+Anything else (or no server) falls through to the typer app in cli.py.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+SOCKET_ENV = "MINI_POSTCODE_LOOKUP_SOCKET"
+
+# the get-postcode default in cli.py
+DEFAULT_AREA_TYPE = "pcon_2024"
+
+
+def unix_sockets_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def default_socket_path() -> Optional[Path]:
+    """
+    Socket location, from the environment variable if set,
+    otherwise the user's runtime (or temp) directory.
+    None where Unix domain sockets aren't available (e.g. Windows).
+    """
+    if not unix_sockets_supported():
+        return None
+    if SOCKET_ENV in os.environ:
+        return Path(os.environ[SOCKET_ENV])
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "mini-postcode-lookup.sock"
+    return Path(tempfile.gettempdir()) / f"mini-postcode-lookup-{os.getuid()}.sock"
+
+
+def check_socket_owner(socket_path: Path):
+    """
+    Refuse a socket owned by another user. Without XDG_RUNTIME_DIR the
+    default path is in the shared temp directory, where anyone could
+    create it and serve forged answers.
+    """
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} is owned by another user")
+
+
+def is_running(socket_path: Optional[Path] = None) -> bool:
+    if socket_path is None:
+        socket_path = default_socket_path()
+    if socket_path is None:
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(socket_path))
+    except OSError:
+        return False
+    return True
+
+
+class LookupClient:
+    """
+    Connection to a running lookup server.
+    Socket errors (including timeouts) are raised as OSError so
+    callers can fall back to a local lookup.
+    """
+
+    def __init__(self, socket_path: Path, timeout: float = 60):
+        check_socket_owner(socket_path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.settimeout(timeout)
+            self.socket.connect(str(socket_path))
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile("rwb")
+
+    @classmethod
+    def connect(
+        cls, socket_path: Optional[Path] = None, timeout: float = 60
+    ) -> Optional[LookupClient]:
+        """
+        Connect to the server if it is running, otherwise return None
+        """
+        if socket_path is None:
+            socket_path = default_socket_path()
+        if socket_path is None:
+            return None
+        try:
+            return cls(socket_path, timeout=timeout)
+        except OSError:
+            return None
+
+    def get_values(
+        self,
+        postcodes: list[str],
+        area_types: Sequence[str],
+        reject_unknown: bool = False,
+    ) -> dict[str, list[Optional[str]]]:
+        request = {
+            "postcodes": postcodes,
+            "area_types": [str(x) for x in area_types],
+            "reject_unknown": reject_unknown,
+        }
+        self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Lookup server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ValueError(f"Lookup server error: {response['error']}")
+        return response["values"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+def parse_get_postcode(args: list[str]) -> Optional[tuple[str, str, bool]]:
+    """
+    Postcode, area type and reject_unknown for a plain `get-postcode` call,
+    or None for anything that needs the full command line app
+    """
+    if not args or args[0] != "get-postcode":
+        return None
+    postcode = None
+    area_type = DEFAULT_AREA_TYPE
+    reject_unknown = False
+    rest = iter(args[1:])
+    for arg in rest:
+        if arg == "--area-type":
+            area_type = next(rest, "")
+        elif arg.startswith("--area-type="):
+            area_type = arg.split("=", 1)[1]
+        elif arg in ["--reject-unknown", "--no-reject-unknown"]:
+            reject_unknown = arg == "--reject-unknown"
+        elif arg == "--use-daemon":
+            continue
+        elif arg.startswith("-") or postcode is not None:
+            return None
+        else:
+            postcode = arg
+    if postcode is None or not area_type:
+        return None
+    return postcode, area_type, reject_unknown
+
+
+def main():
+    """
+    Command line entry point.
+    Answers get-postcode from a running lookup server if there is one,
+    otherwise runs the full app.
+    """
+    request = parse_get_postcode(sys.argv[1:])
+    if request is not None:
+        postcode, area_type, reject_unknown = request
+        client = LookupClient.connect()
+        if client is not None:
+            try:
+                with client:
+                    values = client.get_values([postcode], [area_type], reject_unknown)
+            except (OSError, ValueError):
+                # server gone, busy or rejected the request (e.g. an unknown
+                # area type), so let the full app handle it
+                pass
+            else:
+                value = values[area_type][0]
+                print("" if value is None else value)
+                return
+
+    from .cli import app
+
+    app()
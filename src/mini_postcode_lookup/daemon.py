@@ -0,0 +1,101 @@
+"""
+Long-lived lookup server on a Unix domain socket.
+
+Keeps the lookup tables loaded so that repeated command line calls
+don't pay for importing pandas and loading the tables each time
+(the client side, in client.py, only uses the standard library).
+
+The protocol is one JSON object per line in each direction:
+
+- request: {"postcodes": [...], "area_types": [...], "reject_unknown": false}
+- response: {"values": {"<area_type>": [...]}} or {"error": "..."}
+"""
+
+from __future__ import annotations
+
+import json
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any, Optional, cast
+
+from .client import default_socket_path, is_running
+from .process import AllowedAreaTypes, MiniPostcodeLookup, lookup_values
+
+
+class LookupHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = cast(LookupServer, self.server)
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                area_types = [AllowedAreaTypes(x) for x in request["area_types"]]
+                reject_unknown = request.get("reject_unknown", False)
+                server.load(area_types, reject_unknown)
+                response: dict[str, Any] = {
+                    "values": lookup_values(
+                        server.lookup,
+                        request["postcodes"],
+                        area_types,
+                        reject_unknown=reject_unknown,
+                    )
+                }
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class LookupServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Handles each connection in its own thread, so a long running
+    stream doesn't block other clients
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, lookup: MiniPostcodeLookup):
+        self.lookup = lookup
+        self.load_lock = threading.Lock()
+        super().__init__(str(socket_path), LookupHandler)
+
+    def load(self, area_types: list[AllowedAreaTypes], reject_unknown: bool):
+        """
+        Load any tables a request needs that aren't loaded yet.
+        Lookups only read the tables, so only loading needs the lock.
+        """
+        with self.load_lock:
+            for area_type in area_types:
+                self.lookup.check_and_load_area(area_type)
+            if reject_unknown:
+                self.lookup.check_and_load_membership().decode()
+
+
+def serve(
+    socket_path: Optional[Path] = None,
+    preload: list[AllowedAreaTypes] = [],
+    ready: Optional[Any] = None,
+):
+    """
+    Run the lookup server until interrupted.
+    ready is an optional threading.Event set once the socket is listening.
+    """
+    if socket_path is None:
+        socket_path = default_socket_path()
+    if socket_path is None:
+        raise ValueError("The lookup server needs Unix domain sockets")
+
+    if socket_path.exists():
+        if is_running(socket_path):
+            raise ValueError(f"Lookup server already running at {socket_path}")
+        # left over from a server that didn't shut down cleanly
+        socket_path.unlink()
+
+    lookup = MiniPostcodeLookup(preload=preload)
+    with LookupServer(socket_path, lookup) as server:
+        if ready is not None:
+            ready.set()
+        try:
+            server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
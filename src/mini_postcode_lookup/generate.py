@@ -4,14 +4,22 @@ Script to generate lookups for different kinds of geography
 
 import json
 import pickle
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Union
+from typing import Callable, Optional, Union
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
+from .binary import read_arrays, varint_encode, write_arrays
+
 dest_folder = Path(__file__).parent / "data"
+docs_folder = Path(__file__).parents[2] / "docs"
+
+# Tables that are also exported in the binary format for the browser client
+BROWSER_TABLES = ["pcon_2024"]
 
 # Remove NI data
 LIMIT_NI = False
@@ -69,6 +77,24 @@ class PostcodeRangeLookup:
         with path.open("w") as f:
             json.dump(self.to_dict(), f, separators=(",", ":"))
 
+    def to_binary(self, path: Path):
+        """
+        Store for the browser client, using the same compression as to_dict
+        but with each list as a stream of varints rather than json numbers.
+        Missing values (NaN) are stored as null.
+        """
+        value_values = [x if isinstance(x, str) else None for x in self.value_values]
+        write_arrays(
+            path,
+            {
+                "postcode_keys": varint_encode(
+                    np.array(difference_compression(self.postcode_keys))
+                ),
+                "value_key": varint_encode(np.array(drop_minus_one(self.value_key))),
+            },
+            {"value_values": value_values, "count": len(self.postcode_keys)},
+        )
+
     @classmethod
     def from_json(cls, path: Path):
         with path.open("r") as f:
@@ -88,6 +114,42 @@ def postcode_to_int(postcode: str) -> int:
     return int(postcode.replace(" ", "").upper(), 36)
 
 
+def create_membership(postcodes: pd.Series, *, dest: Path, block_size: int = 128):
+    """
+    Store every postcode as a sorted list of integer keys, compressed as blocks.
+    Each block stores its first key in full, then the gaps to the
+    following keys as varints (mostly a single byte).
+
+    The position of a postcode in the sorted list is also used to
+    line up other per-postcode data (e.g. coordinates).
+    """
+    keys = np.unique(
+        np.array([postcode_to_int(x) for x in postcodes.dropna()], dtype=np.int64)  # type: ignore
+    )
+
+    is_block_start = np.arange(len(keys)) % block_size == 0
+    gaps = np.diff(keys, prepend=0)[~is_block_start]
+
+    stream = varint_encode(gaps)
+    # byte offset of the start of each block's gaps in the stream
+    varint_starts = np.concatenate([[0], np.flatnonzero((stream & 0x80) == 0) + 1])
+    first_gap = np.arange(is_block_start.sum()) * (block_size - 1)
+    block_offsets = np.append(varint_starts[first_gap], len(stream))
+
+    if not dest_folder.exists():
+        dest_folder.mkdir()
+
+    write_arrays(
+        dest,
+        {
+            "block_first": keys[is_block_start].astype("<i8"),
+            "block_offsets": block_offsets.astype("<u8"),
+            "gaps": stream,
+        },
+        {"count": len(keys), "block_size": block_size},
+    )
+
+
 def create_range(
     df: pd.DataFrame,
     *,
@@ -133,6 +195,98 @@ def create_range(
     result.to_json(dest)
 
 
+@dataclass
+class VerifyResult:
+    slug: str
+    checked: int
+    skipped: int
+    mismatches: pd.DataFrame
+
+    @property
+    def ok(self) -> bool:
+        return len(self.mismatches) == 0
+
+
+def verify_values(
+    df: pd.DataFrame,
+    *,
+    postcode_col: str,
+    value_col: str,
+    get_values: Callable[[np.ndarray], np.ndarray],
+    int_postcodes: Optional[np.ndarray] = None,
+) -> tuple[int, int, pd.DataFrame]:
+    """
+    Compare every postcode in the source with the values get_values gives
+    for them (from postcodes_to_ints), as one vectorised batch.
+    int_postcodes can be the postcode column already converted, to share
+    the conversion between checks of the same source.
+    Returns the number checked, the number skipped (not valid postcodes),
+    and a dataframe of mismatches.
+    """
+    from .process import postcodes_to_ints
+
+    if int_postcodes is None:
+        int_postcodes = postcodes_to_ints(df[postcode_col])
+    valid = int_postcodes >= 0
+
+    expected = df[value_col][valid]
+    found = pd.Series(get_values(int_postcodes[valid]), index=expected.index)
+    match = (expected == found) | (expected.isna() & found.isna())
+
+    mismatches = pd.DataFrame(
+        {
+            "postcode": df[postcode_col][valid][~match],
+            "expected": expected[~match],
+            "found": found[~match],
+        }
+    )
+    return int(valid.sum()), int((~valid).sum()), mismatches
+
+
+def verify_range(
+    df: pd.DataFrame,
+    *,
+    postcode_col: str,
+    value_col: str,
+    lookup_path: Path,
+    int_postcodes: Optional[np.ndarray] = None,
+) -> tuple[int, int, pd.DataFrame]:
+    """
+    Compare every postcode in the source with the stored range lookup
+    """
+    from .process import PostcodeRangeLookup as StoredLookup
+
+    lookup = StoredLookup.from_json(lookup_path)
+    return verify_values(
+        df,
+        postcode_col=postcode_col,
+        value_col=value_col,
+        get_values=lookup.get_values,
+        int_postcodes=int_postcodes,
+    )
+
+
+def read_source(
+    source: Union[Path, str], columns: list[str], postcode_col: str
+) -> pd.DataFrame:
+    """
+    Read the columns needed from a csv or parquet source
+    """
+    str_path = str(source)
+    if str_path.lower().endswith(".parquet"):
+        df = pd.read_parquet(str_path, columns=columns)
+    else:
+        df = pd.read_csv(str_path, usecols=columns)  # type: ignore
+
+    if LIMIT_NI:
+        df = df[~df[postcode_col].str.startswith("BT")]  # type: ignore
+
+    if not isinstance(df, pd.DataFrame):  # type: ignore
+        raise ValueError(f"Expected a DataFrame, got {type(df)}")
+
+    return df
+
+
 class BaseLookupCreator:
     slug = ""
     postcode_col = ""
@@ -140,23 +294,15 @@ class BaseLookupCreator:
     df_source: Union[Path, str] = ""
     test_df_source: Union[Path, str] = ""
 
-    def get_df(self, test: bool = False) -> pd.DataFrame:
-        str_path = str(self.test_df_source) if test else str(self.df_source)
-        if str_path.lower().endswith(".parquet"):
-            df = pd.read_parquet(str_path, columns=[self.postcode_col, self.value_col])
-        else:
-            df = pd.read_csv(  # type: ignore
-                str_path,
-                usecols=[self.postcode_col, self.value_col],  # type: ignore
-            )
-
-        if LIMIT_NI:
-            df = df[~df[self.postcode_col].str.startswith("BT")]  # type: ignore
+    @property
+    def verify_columns(self) -> list[str]:
+        return [self.postcode_col, self.value_col]
 
-        if not isinstance(df, pd.DataFrame):  # type: ignore
-            raise ValueError(f"Expected a DataFrame, got {type(df)}")
+    def source(self, test: bool = False) -> Union[Path, str]:
+        return self.test_df_source if test else self.df_source
 
-        return df
+    def get_df(self, test: bool = False) -> pd.DataFrame:
+        return read_source(self.source(test), self.verify_columns, self.postcode_col)
 
     def create(self, *, force: bool = False):
         dest = dest_folder / f"{self.slug}.json"
@@ -172,6 +318,289 @@ class BaseLookupCreator:
             dest=dest,
         )
 
+    def verify(
+        self,
+        test: bool = False,
+        df: Optional[pd.DataFrame] = None,
+        int_postcodes: Optional[np.ndarray] = None,
+    ) -> VerifyResult:
+        """
+        Check the generated lookup against every postcode in the source.
+        df can be a source already read with (at least) verify_columns,
+        and int_postcodes its postcode column from postcodes_to_ints.
+        """
+        if df is None:
+            df = self.get_df(test=test)
+        checked, skipped, mismatches = verify_range(
+            df,
+            postcode_col=self.postcode_col,
+            value_col=self.value_col,
+            lookup_path=dest_folder / f"{self.slug}.json",
+            int_postcodes=int_postcodes,
+        )
+        return VerifyResult(
+            slug=self.slug, checked=checked, skipped=skipped, mismatches=mismatches
+        )
+
+
+def create_parent_map(
+    df: pd.DataFrame,
+    *,
+    child_col: str,
+    parent_cols: dict[str, str],
+    child_values: list[str],
+    child_label: str,
+    dest: Path,
+):
+    """
+    Store, for each value of a child range lookup (e.g. LSOA), the index of the
+    parent area (e.g. local authority) it sits inside.
+
+    The arrays are in the same order as the child lookup's value_values, so a
+    single search of the child table gives the parent by array lookup.
+    Where a child straddles parents at postcode level, the most common parent is used.
+    """
+    arrays: dict[str, np.ndarray] = {}
+    parent_values: dict[str, list[str]] = {}
+
+    for label, parent_col in parent_cols.items():
+        pairs = df[[child_col, parent_col]].dropna()  # type: ignore
+        most_common = (
+            pairs.groupby(child_col)[parent_col]  # type: ignore
+            .agg(lambda x: x.mode().iloc[0])  # type: ignore
+            .to_dict()
+        )
+        unique_values = sorted(set(most_common.values()), key=str)  # type: ignore
+        value_to_int = {value: i for i, value in enumerate(unique_values)}
+        missing = len(unique_values)
+
+        arrays[label] = np.array(
+            [value_to_int.get(most_common.get(x), missing) for x in child_values],  # type: ignore
+            dtype="<u4",
+        )
+        parent_values[label] = unique_values
+
+    if not dest_folder.exists():
+        dest_folder.mkdir()
+
+    meta = {
+        "child": child_label,
+        "child_count": len(child_values),
+        "value_values": parent_values,
+    }
+    write_arrays(dest, arrays, meta)
+
+
+# scale for storing latitude and longitude as integers (about 0.1m)
+COORDINATE_SCALE = 1_000_000
+MISSING_COORDINATE = np.iinfo(np.int32).min
+
+
+def create_coordinates(
+    df: pd.DataFrame,
+    *,
+    postcode_col: str,
+    dest: Path,
+    latitude_col: str = "lat",
+    longitude_col: str = "long",
+    easting_col: str = "oseast1m",
+    northing_col: str = "osnrth1m",
+):
+    """
+    Store the centroid of each postcode as int32 arrays, in the same
+    sorted order as the postcode membership list.
+    Latitude and longitude are scaled by COORDINATE_SCALE,
+    eastings and northings are in metres.
+    """
+    df = df.dropna(subset=[postcode_col])  # type: ignore
+    df = df.assign(
+        postcode_int=[postcode_to_int(x) for x in df[postcode_col]]  # type: ignore
+    )
+    df = df.drop_duplicates("postcode_int").sort_values("postcode_int")  # type: ignore
+
+    # ONSPD uses 99.999999 for postcodes without a grid reference
+    no_location = df[latitude_col].isna() | (df[latitude_col] > 90)  # type: ignore
+
+    def quantise(col: str, scale: int) -> np.ndarray:
+        values = np.round(df[col].to_numpy(float) * scale)  # type: ignore
+        values[no_location.to_numpy() | np.isnan(values)] = MISSING_COORDINATE
+        return values.astype("<i4")
+
+    if not dest_folder.exists():
+        dest_folder.mkdir()
+
+    write_arrays(
+        dest,
+        {
+            "latitude": quantise(latitude_col, COORDINATE_SCALE),
+            "longitude": quantise(longitude_col, COORDINATE_SCALE),
+            "easting": quantise(easting_col, 1),
+            "northing": quantise(northing_col, 1),
+        },
+        {"count": len(df), "scale": COORDINATE_SCALE},
+    )
+
+
+# grid cell size for the spatial index, in scaled coordinate units
+# (about 280m north-south, 260m east-west in the UK)
+GRID_CELL_LATITUDE = 2500
+GRID_CELL_LONGITUDE = 4000
+
+
+def create_spatial_index(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    postcode_keys: np.ndarray,
+    *,
+    dest: Path,
+    include: Optional[np.ndarray] = None,
+    cell_latitude: int = GRID_CELL_LATITUDE,
+    cell_longitude: int = GRID_CELL_LONGITUDE,
+):
+    """
+    Create a grid index of postcode centroids for nearest postcode searches.
+
+    latitude and longitude are the scaled int32 arrays from create_coordinates,
+    and postcode_keys the sorted postcode keys they line up with.
+    Postcode keys and coordinates are grouped by grid cell, with a sorted list
+    of the cells that contain postcodes and where each cell starts, so searches
+    don't need the full postcode list or coordinates.
+    """
+    usable = latitude != MISSING_COORDINATE
+    if include is not None:
+        usable &= include
+    indexes = np.flatnonzero(usable)
+
+    origin_latitude = int(latitude[indexes].min())
+    origin_longitude = int(longitude[indexes].min())
+    rows = (latitude[indexes].astype(np.int64) - origin_latitude) // cell_latitude
+    cols = (longitude[indexes].astype(np.int64) - origin_longitude) // cell_longitude
+    column_count = int(cols.max()) + 1
+    cell_ids = rows * column_count + cols
+
+    order = np.argsort(cell_ids, kind="stable")
+    cell_ids = cell_ids[order]
+    unique_cells, cell_starts = np.unique(cell_ids, return_index=True)
+    indexes = indexes[order]
+
+    if not dest_folder.exists():
+        dest_folder.mkdir()
+
+    write_arrays(
+        dest,
+        {
+            "cell_ids": unique_cells.astype("<i8"),
+            "cell_starts": np.append(cell_starts, len(cell_ids)).astype("<u4"),
+            "postcode_keys": postcode_keys[indexes].astype("<i8"),
+            "latitude": latitude[indexes].astype("<i4"),
+            "longitude": longitude[indexes].astype("<i4"),
+        },
+        {
+            "scale": COORDINATE_SCALE,
+            "origin_latitude": origin_latitude,
+            "origin_longitude": origin_longitude,
+            "cell_latitude": cell_latitude,
+            "cell_longitude": cell_longitude,
+            "column_count": column_count,
+            "row_count": int(rows.max()) + 1,
+        },
+    )
+
+
+class PostcodeMembershipCreator:
+    """
+    Creates the list of all postcodes, used to check a postcode exists
+    """
+
+    slug = "postcodes"
+    postcode_col = "pcd"
+    df_source = Path("data", "raw", "onspd.csv")
+    test_df_source = Path("data", "onspd_100000.csv")
+
+    def get_df(self, test: bool = False) -> pd.DataFrame:
+        str_path = str(self.test_df_source if test else self.df_source)
+        df = pd.read_csv(str_path, usecols=[self.postcode_col])  # type: ignore
+        if LIMIT_NI:
+            df = df[~df[self.postcode_col].str.startswith("BT")]  # type: ignore
+        return df
+
+    def create(self, *, force: bool = False):
+        dest = dest_folder / f"{self.slug}.bin"
+
+        if dest.exists() and not force:
+            return
+
+        create_membership(self.get_df()[self.postcode_col], dest=dest)
+
+
+class PostcodeCoordinatesCreator(PostcodeMembershipCreator):
+    """
+    Creates the centroid of each postcode, lined up with the postcode list
+    """
+
+    slug = "postcode_coordinates"
+    coordinate_cols = ["lat", "long", "oseast1m", "osnrth1m"]
+
+    def get_df(self, test: bool = False) -> pd.DataFrame:
+        str_path = str(self.test_df_source if test else self.df_source)
+        df = pd.read_csv(  # type: ignore
+            str_path, usecols=[self.postcode_col] + self.coordinate_cols
+        )
+        if LIMIT_NI:
+            df = df[~df[self.postcode_col].str.startswith("BT")]  # type: ignore
+        return df
+
+    def create(self, *, force: bool = False):
+        dest = dest_folder / f"{self.slug}.bin"
+
+        if dest.exists() and not force:
+            return
+
+        create_coordinates(self.get_df(), postcode_col=self.postcode_col, dest=dest)
+
+
+class SpatialIndexCreator(PostcodeMembershipCreator):
+    """
+    Creates the grid index used to find the nearest live postcode to a point.
+    Needs the postcode coordinates to have been created first.
+    """
+
+    slug = "postcode_grid"
+    terminated_col = "doterm"
+
+    def get_df(self, test: bool = False) -> pd.DataFrame:
+        str_path = str(self.test_df_source if test else self.df_source)
+        df = pd.read_csv(  # type: ignore
+            str_path, usecols=[self.postcode_col, self.terminated_col]
+        )
+        if LIMIT_NI:
+            df = df[~df[self.postcode_col].str.startswith("BT")]  # type: ignore
+        return df
+
+    def create(self, *, force: bool = False):
+        dest = dest_folder / f"{self.slug}.bin"
+
+        if dest.exists() and not force:
+            return
+
+        arrays, _ = read_arrays(dest_folder / "postcode_coordinates.bin", mmap=False)
+
+        # line up with the order of the coordinates (sorted unique postcodes)
+        df = self.get_df().dropna(subset=[self.postcode_col])  # type: ignore
+        df = df.assign(
+            postcode_int=[postcode_to_int(x) for x in df[self.postcode_col]]  # type: ignore
+        )
+        df = df.drop_duplicates("postcode_int").sort_values("postcode_int")  # type: ignore
+        live = df[self.terminated_col].isna().to_numpy()  # type: ignore
+
+        create_spatial_index(
+            arrays["latitude"],
+            arrays["longitude"],
+            df["postcode_int"].to_numpy(),  # type: ignore
+            dest=dest,
+            include=live,
+        )
+
 
 class FutureConstituenciesLookupCreator(BaseLookupCreator):
     slug = "pcon_2024"
@@ -205,18 +634,208 @@ class LSOALookupCreator(BaseLookupCreator):
     test_df_source = Path("data", "onspd_100000.csv")
 
 
+class ParentLookupCreator:
+    """
+    Creates value to value maps from a child lookup to the
+    geographies that contain it.
+    Needs the child lookup to have been created first.
+    """
+
+    child = LSOALookupCreator()
+    parent_cols = {"region": "rgn"}
+
+    @property
+    def slug(self):
+        return f"{self.child.slug}_parents"
+
+    @property
+    def verify_columns(self) -> list[str]:
+        return [self.child.postcode_col, *self.parent_cols.values()]
+
+    def source(self, test: bool = False) -> Union[Path, str]:
+        return self.child.source(test)
+
+    def get_df(self, test: bool = False) -> pd.DataFrame:
+        columns = [self.child.postcode_col, self.child.value_col] + list(
+            self.parent_cols.values()
+        )
+        return read_source(self.source(test), columns, self.child.postcode_col)
+
+    def create(self, *, force: bool = False):
+        dest = dest_folder / f"{self.slug}.bin"
+
+        if dest.exists() and not force:
+            return
+
+        with (dest_folder / f"{self.child.slug}.json").open() as f:
+            child_values = json.load(f)["value_values"]
+
+        create_parent_map(
+            self.get_df(),
+            child_col=self.child.value_col,
+            parent_cols=self.parent_cols,
+            child_values=child_values,
+            child_label=self.child.slug,
+            dest=dest,
+        )
+
+    def verify(
+        self,
+        test: bool = False,
+        df: Optional[pd.DataFrame] = None,
+        int_postcodes: Optional[np.ndarray] = None,
+    ) -> list[VerifyResult]:
+        """
+        Check the nested area types (child lookup then parent map)
+        against every postcode in the source
+        """
+        from .process import NestedAreaTypes, ParentLookup, postcodes_to_ints
+        from .process import PostcodeRangeLookup as StoredLookup
+
+        if df is None:
+            df = read_source(
+                self.source(test), self.verify_columns, self.child.postcode_col
+            )
+        if int_postcodes is None:
+            int_postcodes = postcodes_to_ints(df[self.child.postcode_col])  # type: ignore
+        child = StoredLookup.from_json(dest_folder / f"{self.child.slug}.json")
+        parents = ParentLookup.from_binary(dest_folder / f"{self.slug}.bin")
+
+        results: list[VerifyResult] = []
+        for label, parent_col in self.parent_cols.items():
+            area_type = NestedAreaTypes(label)
+
+            # used straight away, so picking up the loop variable is fine
+            def get_values(int_postcodes: np.ndarray) -> np.ndarray:
+                return parents.get_values(child.get_indexes(int_postcodes), area_type)
+
+            checked, skipped, mismatches = verify_values(
+                df,
+                postcode_col=self.child.postcode_col,
+                value_col=parent_col,
+                get_values=get_values,
+                int_postcodes=int_postcodes,
+            )
+            results.append(
+                VerifyResult(
+                    slug=label, checked=checked, skipped=skipped, mismatches=mismatches
+                )
+            )
+        return results
+
+
+range_creators: list[BaseLookupCreator] = [
+    FutureConstituenciesLookupCreator(),
+    LocalAuthoritiesLookupCreator(),
+    PCONLookupCreator(),
+    LSOALookupCreator(),
+]
+
+
+def verify(test: bool = False) -> bool:
+    """
+    Check each generated range lookup, and the nested area types from the
+    parent map, against their full sources.
+    Each source (e.g. ONSPD) is read once with the columns all its checks need.
+    Prints a summary (and a sample of mismatches) and returns
+    True if everything matches.
+    """
+    from .process import postcodes_to_ints
+
+    parents = ParentLookupCreator()
+    creators: list[Union[BaseLookupCreator, ParentLookupCreator]] = []
+    for creator in [*range_creators, parents]:
+        suffix = "bin" if creator is parents else "json"
+        if (dest_folder / f"{creator.slug}.{suffix}").exists():
+            creators.append(creator)
+        else:
+            print(f"Skipping {creator.slug}: not generated")
+
+    columns: dict[str, list[str]] = {}
+    for creator in creators:
+        source = str(creator.source(test))
+        columns[source] = list(
+            dict.fromkeys(columns.get(source, []) + creator.verify_columns)
+        )
+
+    all_ok = True
+    for source, source_columns in columns.items():
+        # each creator's verify_columns start with its postcode column
+        df = read_source(source, source_columns, source_columns[0])
+        # converted once per postcode column, and shared between the checks
+        int_postcodes: dict[str, np.ndarray] = {}
+        results: list[VerifyResult] = []
+        for creator in creators:
+            if str(creator.source(test)) != source:
+                continue
+            postcode_col = creator.verify_columns[0]
+            if postcode_col not in int_postcodes:
+                int_postcodes[postcode_col] = postcodes_to_ints(df[postcode_col])  # type: ignore
+            result = creator.verify(
+                test=test, df=df, int_postcodes=int_postcodes[postcode_col]
+            )
+            if isinstance(result, list):
+                results.extend(result)
+            else:
+                results.append(result)
+        all_ok = report_results(results) and all_ok
+    return all_ok
+
+
+def report_results(results: list[VerifyResult]) -> bool:
+    """
+    Print a summary of each result, returning True if all match
+    """
+    all_ok = True
+    for result in results:
+        print(
+            f"{result.slug}: {result.checked} postcodes checked, "
+            f"{result.skipped} invalid postcodes skipped, "
+            f"{len(result.mismatches)} mismatches"
+        )
+        if not result.ok:
+            all_ok = False
+            print(result.mismatches.head(10).to_string(index=False))
+    return all_ok
+
+
+def export_browser_table(slug: str, dest: Path):
+    """
+    Convert a generated json lookup into the binary format used by docs/,
+    and copy the json alongside it for clients that still fetch that
+    """
+    from .process import PostcodeRangeLookup as StoredLookup
+
+    stored = StoredLookup.from_area_type(slug)
+    PostcodeRangeLookup(
+        postcode_keys=list(stored.postcode_keys),
+        value_key=list(stored.value_key),
+        value_values=stored.value_values,
+    ).to_binary(dest)
+    shutil.copyfile(dest_folder / f"{slug}.json", dest.with_suffix(".json"))
+
+
 def generate(force: bool = False):
     creators = [
-        FutureConstituenciesLookupCreator(),
-        LocalAuthoritiesLookupCreator(),
-        PCONLookupCreator(),
-        LSOALookupCreator(),
+        *range_creators,
+        ParentLookupCreator(),
+        PostcodeMembershipCreator(),
+        PostcodeCoordinatesCreator(),
+        SpatialIndexCreator(),
     ]
 
     for creator in creators:
         print(f"Creating {creator.slug}")
         creator.create(force=force)
 
+    if docs_folder.exists():
+        for slug in BROWSER_TABLES:
+            dest = docs_folder / f"{slug}.bin"
+            if dest.exists() and not force:
+                continue
+            print(f"Exporting {slug} for browser")
+            export_browser_table(slug, dest)
+
 
 if __name__ == "__main__":
     generate(force=True)
@@ -2,15 +2,18 @@ from __future__ import annotations
 
 import bisect
 import json
+import math
 import re
 from array import array
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, TypedDict, Union
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional, TypedDict, Union
 
+import numpy as np
 import pandas as pd
 import requests
 import rich
 
+from .binary import read_arrays, varint_decode
 from .util import StrEnum
 
 if TYPE_CHECKING:
@@ -47,8 +50,41 @@ class AllowedAreaTypes(StrEnum):
     LSOA = "lsoa"
 
 
+class NestedAreaTypes(StrEnum):
+    """
+    Area types without their own range table, worked out from the
+    parent map of a smaller geography. The parent map is not shipped
+    with the package and is created by generate-lookups.
+    """
+
+    REGION = "region"
+
+
+AreaType = Union[AllowedAreaTypes, NestedAreaTypes]
+
+
+class FileFormat(StrEnum):
+    CSV = "csv"
+    PARQUET = "parquet"
+    FEATHER = "feather"
+
+    @classmethod
+    def from_path(cls, path: Path) -> FileFormat:
+        suffix = path.suffix.lower()
+        if suffix in [".parquet", ".pq"]:
+            return cls.PARQUET
+        if suffix in [".feather", ".arrow", ".ipc"]:
+            return cls.FEATHER
+        return cls.CSV
+
+
 areas_with_lookups = [AllowedAreaTypes.PCON_2024, AllowedAreaTypes.LOCAL_AUTHORITIES]
 
+# the smaller geography each nested area type is worked out from
+nested_area_types: dict[AreaType, AllowedAreaTypes] = {
+    NestedAreaTypes.REGION: AllowedAreaTypes.LSOA,
+}
+
 
 postcode_regex = re.compile(
     r"^(?:"
@@ -61,10 +97,27 @@ postcode_regex = re.compile(
     r")[0-9][A-Z]{2}$"
 )
 
+# longest postcode without the space
+POSTCODE_WIDTH = 7
+
 
 data_folder = Path(__file__).parent / "data"
 
 
+def generated_file(filename: str) -> Path:
+    """
+    Path to a data file that is created by generate-lookups
+    rather than shipped with the package
+    """
+    path = data_folder / filename
+    if not path.exists():
+        raise FileNotFoundError(
+            f"{filename} is not included in the package. "
+            "Run `python -m mini_postcode_lookup generate-lookups` to create it."
+        )
+    return path
+
+
 def load_lookup(area_type: AllowedAreaTypes) -> pd.DataFrame:
     file_loc = data_folder / "lookups" / f"{area_type}_lookup.json"
 
@@ -127,8 +180,70 @@ def postcode_to_int(postcode: str) -> int:
     return int(postcode.replace(" ", "").upper(), 36)
 
 
+def postcodes_to_ints(series: Series) -> np.ndarray[Any, Any]:
+    """
+    Vectorised postcode_to_int for a series of postcodes.
+    Values that are not valid postcodes become -1.
+    """
+    cleaned = (
+        series.astype("string").str.replace(" ", "", regex=False).str.upper()  # type: ignore
+    )
+    valid = cleaned.str.match(postcode_regex.pattern).fillna(False).to_numpy(bool)  # type: ignore
+    result = np.full(len(series), -1, dtype=np.int64)
+    if not valid.any():
+        return result
+    # left pad with zeros (which don't change the value) to a fixed width,
+    # then read the characters as base 36 digits
+    padded = (
+        cleaned[valid]
+        .str.pad(POSTCODE_WIDTH, side="left", fillchar="0")  # type: ignore
+        .to_numpy(dtype=f"S{POSTCODE_WIDTH}")
+    )
+    digits = (
+        np.frombuffer(padded.tobytes(), dtype=np.uint8)
+        .reshape(-1, POSTCODE_WIDTH)
+        .astype(np.int64)
+    )
+    digits = np.where(digits >= ord("A"), digits - ord("A") + 10, digits - ord("0"))
+    result[valid] = digits @ (
+        36 ** np.arange(POSTCODE_WIDTH - 1, -1, -1, dtype=np.int64)
+    )
+    return result
+
+
+def int_to_postcode(int_postcode: int) -> str:
+    """
+    Reverse of postcode_to_int, with a space before the inward code
+    """
+    chars: list[str] = []
+    while int_postcode:
+        int_postcode, remainder = divmod(int_postcode, 36)
+        chars.append(BASE_36_DIGITS[remainder])
+    postcode = "".join(reversed(chars))
+    return f"{postcode[:-3]} {postcode[-3:]}"
+
+
+def index_array_to_values(
+    indexes: np.ndarray[Any, Any], values: list[Any]
+) -> np.ndarray[Any, Any]:
+    """
+    Convert an array of indexes into values, with -1 or
+    out of range indexes becoming None
+    """
+    lookup = np.empty(len(values) + 1, dtype=object)
+    lookup[:-1] = values
+    lookup[-1] = None
+    indexes = np.where((indexes < 0) | (indexes >= len(values)), len(values), indexes)
+    return lookup[indexes]
+
+
 DEBUG = False
 
+BASE_36_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# metres per degree of latitude (and of longitude at the equator)
+METRES_PER_DEGREE = 6_371_000 * math.pi / 180
+
 
 class PostcodeRangeLookup:
     def __init__(
@@ -139,6 +254,17 @@ class PostcodeRangeLookup:
         self.value_values = value_values
 
     def get_value(self, postcode: str, check_valid_postcode: bool = True):
+        value_index = self.get_index(postcode, check_valid_postcode)
+        if value_index is None:
+            return None
+        return self.value_values[value_index]
+
+    def get_index(
+        self, postcode: str, check_valid_postcode: bool = True
+    ) -> Optional[int]:
+        """
+        Get the index of the postcode's value in value_values
+        """
         if check_valid_postcode and not check_real_postcode(postcode):
             if DEBUG:
                 print(f"Invalid postcode: {postcode}")
@@ -162,7 +288,26 @@ class PostcodeRangeLookup:
         if value_index == -1 or value_index >= len(self.value_values):
             return None
         else:
-            return self.value_values[value_index]
+            return value_index
+
+    def get_indexes(self, int_postcodes: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        """
+        Vectorised get_index for postcodes already converted with postcodes_to_ints.
+        Missing values are -1.
+        """
+        keys = np.frombuffer(self.postcode_keys, dtype=np.int64)
+        value_key = np.frombuffer(self.value_key, dtype=np.int64)
+        position = np.searchsorted(keys, int_postcodes, side="right") - 1
+        found = (position >= 0) & (int_postcodes >= 0)
+        result = np.where(found, value_key[np.maximum(position, 0)], -1)
+        result[result >= len(self.value_values)] = -1
+        return result
+
+    def get_values(self, int_postcodes: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        """
+        Vectorised get_value for postcodes already converted with postcodes_to_ints
+        """
+        return index_array_to_values(self.get_indexes(int_postcodes), self.value_values)
 
     @classmethod
     def from_dict(cls, data: StoredData):
@@ -180,6 +325,17 @@ class PostcodeRangeLookup:
             data = json.load(f)
         return cls.from_dict(data)
 
+    @classmethod
+    def from_binary(cls, path: Path):
+        arrays, meta = read_arrays(path, mmap=False)
+        return cls.from_dict(
+            {
+                "postcode_keys": varint_decode(arrays["postcode_keys"]).tolist(),
+                "value_key": varint_decode(arrays["value_key"]).tolist(),
+                "value_values": meta["value_values"],
+            }
+        )
+
     @classmethod
     def from_json_url(cls, url: str):
         response = requests.get(url)
@@ -192,21 +348,666 @@ class PostcodeRangeLookup:
         return cls.from_json(data_folder / f"{area_type}.json")
 
 
+class ParentLookup:
+    """
+    Maps the value index of a child range lookup (e.g. LSOA)
+    to the parent areas (e.g. local authority) that contain it.
+    child_count is the number of values the child lookup had when the map
+    was made, so a map left over from an older lookup can be spotted.
+    """
+
+    def __init__(
+        self,
+        child: AllowedAreaTypes,
+        parent_keys: dict[str, np.ndarray[Any, Any]],
+        parent_values: dict[str, list[str]],
+        child_count: int,
+    ):
+        self.child = child
+        self.parent_keys = parent_keys
+        self.parent_values = parent_values
+        self.child_count = child_count
+
+    def has_parent(self, area_type: AreaType) -> bool:
+        return area_type in self.parent_keys
+
+    def get_value(self, child_index: Optional[int], area_type: AreaType):
+        if child_index is None:
+            return None
+        keys = self.parent_keys[area_type]
+        if child_index >= len(keys):
+            return None
+        values = self.parent_values[area_type]
+        value_index = int(keys[child_index])
+        if value_index >= len(values):
+            return None
+        return values[value_index]
+
+    def get_values(
+        self, child_indexes: np.ndarray[Any, Any], area_type: AreaType
+    ) -> np.ndarray[Any, Any]:
+        """
+        Vectorised get_value for an array of child indexes (-1 for missing)
+        """
+        keys = self.parent_keys[area_type]
+        found = (child_indexes >= 0) & (child_indexes < len(keys))
+        parent_indexes = np.where(
+            found, keys[np.where(found, child_indexes, 0)].astype(np.int64), -1
+        )
+        return index_array_to_values(parent_indexes, self.parent_values[area_type])
+
+    @classmethod
+    def from_binary(cls, path: Path):
+        arrays, meta = read_arrays(path)
+        return cls(
+            child=AllowedAreaTypes(meta["child"]),
+            parent_keys=arrays,
+            parent_values=meta["value_values"],
+            # maps from before the count was stored never match
+            child_count=meta.get("child_count", -1),
+        )
+
+    @classmethod
+    def from_area_type(cls, area_type: str):
+        return cls.from_binary(generated_file(f"{area_type}_parents.bin"))
+
+
+class PostcodeMembership:
+    """
+    Compact sorted list of every postcode, used to check a postcode exists.
+
+    Keys are stored in blocks: the first key of each block in full, then
+    the gaps to the following keys as varints. Single lookups decode one block,
+    batch lookups decode the whole list into a numpy array once and keep it.
+    """
+
+    def __init__(
+        self,
+        block_first: np.ndarray[Any, Any],
+        block_offsets: np.ndarray[Any, Any],
+        gaps: np.ndarray[Any, Any],
+        count: int,
+        block_size: int,
+    ):
+        self.block_first = block_first
+        self.block_offsets = block_offsets
+        self.gaps = gaps
+        self.count = count
+        self.block_size = block_size
+        self.keys: Optional[np.ndarray[Any, Any]] = None
+
+    def __len__(self):
+        return self.count
+
+    def index_of(self, int_postcode: int) -> Optional[int]:
+        """
+        Position of the postcode in the sorted list, or None if not present
+        """
+        block = int(np.searchsorted(self.block_first, int_postcode, side="right")) - 1
+        if block < 0:
+            return None
+        key = int(self.block_first[block])
+        position = block * self.block_size
+        stream = self.gaps[self.block_offsets[block] : self.block_offsets[block + 1]]
+        gap = 0
+        shift = 0
+        for byte in stream.tolist():
+            if key >= int_postcode:
+                break
+            gap |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                key += gap
+                position += 1
+                gap = 0
+                shift = 0
+        if key == int_postcode:
+            return position
+        return None
+
+    def contains(self, postcode: str) -> bool:
+        if not check_real_postcode(postcode):
+            return False
+        return self.index_of(postcode_to_int(postcode)) is not None
+
+    def decode(self) -> np.ndarray[Any, Any]:
+        """
+        Decode the full sorted list of keys (cached after the first call)
+        """
+        if self.keys is None:
+            self.keys = self._decode()
+        return self.keys
+
+    def _decode(self) -> np.ndarray[Any, Any]:
+        gaps = varint_decode(self.gaps)
+
+        is_block_start = np.arange(self.count) % self.block_size == 0
+        steps = np.empty(self.count, dtype=np.int64)
+        steps[is_block_start] = self.block_first
+        steps[~is_block_start] = gaps
+        # cumulative sum that restarts at each block's first key
+        totals = np.cumsum(steps)
+        block_base = totals[is_block_start] - self.block_first
+        block_lengths = np.diff(np.append(np.flatnonzero(is_block_start), self.count))
+        return totals - np.repeat(block_base, block_lengths)
+
+    def index_of_many(
+        self, int_postcodes: np.ndarray[Any, Any]
+    ) -> np.ndarray[Any, Any]:
+        """
+        Vectorised index_of, for postcodes converted with postcodes_to_ints.
+        Missing postcodes are -1.
+        """
+        keys = self.decode()
+        position = np.searchsorted(keys, int_postcodes)
+        clipped = np.minimum(position, len(keys) - 1)
+        found = (position < len(keys)) & (keys[clipped] == int_postcodes)
+        return np.where(found & (int_postcodes >= 0), clipped, -1)
+
+    def contains_many(
+        self, int_postcodes: np.ndarray[Any, Any]
+    ) -> np.ndarray[Any, Any]:
+        return self.index_of_many(int_postcodes) >= 0
+
+    @classmethod
+    def from_binary(cls, path: Path):
+        arrays, meta = read_arrays(path)
+        return cls(
+            block_first=arrays["block_first"],
+            block_offsets=arrays["block_offsets"],
+            gaps=arrays["gaps"],
+            count=meta["count"],
+            block_size=meta["block_size"],
+        )
+
+    @classmethod
+    def from_data_folder(cls):
+        return cls.from_binary(generated_file("postcodes.bin"))
+
+
+class Coordinates(NamedTuple):
+    latitude: float
+    longitude: float
+    easting: Optional[int]
+    northing: Optional[int]
+
+
+class PostcodeCoordinates:
+    """
+    Centroid of each postcode, stored as int32 arrays in the same order
+    as the PostcodeMembership list (so an index from that list is
+    an index into these arrays).
+    """
+
+    missing = np.iinfo(np.int32).min
+
+    def __init__(
+        self,
+        latitude: np.ndarray[Any, Any],
+        longitude: np.ndarray[Any, Any],
+        easting: np.ndarray[Any, Any],
+        northing: np.ndarray[Any, Any],
+        scale: int,
+    ):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.easting = easting
+        self.northing = northing
+        self.scale = scale
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def get(self, index: Optional[int]) -> Optional[Coordinates]:
+        if index is None or self.latitude[index] == self.missing:
+            return None
+        easting = int(self.easting[index])
+        northing = int(self.northing[index])
+        return Coordinates(
+            latitude=int(self.latitude[index]) / self.scale,
+            longitude=int(self.longitude[index]) / self.scale,
+            easting=None if easting == self.missing else easting,
+            northing=None if northing == self.missing else northing,
+        )
+
+    def get_many(self, indexes: np.ndarray[Any, Any]) -> pd.DataFrame:
+        """
+        Vectorised get, for indexes from PostcodeMembership.index_of_many.
+        Missing values are NaN (or <NA> for eastings and northings).
+        """
+        found = indexes >= 0
+        safe_indexes = np.where(found, indexes, 0)
+
+        def gather(values: np.ndarray[Any, Any]):
+            result = values[safe_indexes]
+            return result, ~found | (result == self.missing)
+
+        columns: dict[str, Any] = {}
+        for name in ["latitude", "longitude"]:
+            values, missing = gather(getattr(self, name))
+            values = values / self.scale
+            values[missing] = np.nan
+            columns[name] = values
+        for name in ["easting", "northing"]:
+            values, missing = gather(getattr(self, name))
+            columns[name] = pd.arrays.IntegerArray(values.astype(np.int32), missing)
+        return pd.DataFrame(columns)
+
+    @classmethod
+    def from_binary(cls, path: Path):
+        arrays, meta = read_arrays(path)
+        return cls(
+            latitude=arrays["latitude"],
+            longitude=arrays["longitude"],
+            easting=arrays["easting"],
+            northing=arrays["northing"],
+            scale=meta["scale"],
+        )
+
+    @classmethod
+    def from_data_folder(cls):
+        return cls.from_binary(generated_file("postcode_coordinates.bin"))
+
+
+class NearestPostcode(NamedTuple):
+    postcode: str
+    distance: float
+
+
+class PostcodeGrid:
+    """
+    Grid index of postcode centroids, used to find the nearest postcode to a point.
+
+    Postcode keys and their scaled coordinates are grouped by grid cell.
+    cell_ids is the sorted list of cells that contain postcodes, and
+    cell_starts where each cell's postcodes start in the other arrays.
+    The arrays are memory mapped rather than loaded.
+    """
+
+    def __init__(
+        self,
+        cell_ids: np.ndarray[Any, Any],
+        cell_starts: np.ndarray[Any, Any],
+        postcode_keys: np.ndarray[Any, Any],
+        latitude: np.ndarray[Any, Any],
+        longitude: np.ndarray[Any, Any],
+        meta: dict[str, int],
+    ):
+        self.cell_ids = cell_ids
+        self.cell_starts = cell_starts.astype(np.int64)
+        self.postcode_keys = postcode_keys
+        self.latitude = latitude
+        self.longitude = longitude
+        self.scale = meta["scale"]
+        self.origin_latitude = meta["origin_latitude"]
+        self.origin_longitude = meta["origin_longitude"]
+        self.cell_latitude = meta["cell_latitude"]
+        self.cell_longitude = meta["cell_longitude"]
+        self.column_count = meta["column_count"]
+        self.row_count = meta["row_count"]
+
+    @staticmethod
+    def ring_offsets(ring: int) -> tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+        """
+        Row and column offsets of the cells exactly `ring` cells away
+        """
+        if ring == 0:
+            return np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        steps = np.arange(-ring, ring + 1)
+        rows = np.concatenate(
+            [
+                np.full(len(steps), -ring),
+                np.full(len(steps), ring),
+                steps[1:-1],
+                steps[1:-1],
+            ]
+        )
+        cols = np.concatenate(
+            [
+                steps,
+                steps,
+                np.full(len(steps) - 2, -ring),
+                np.full(len(steps) - 2, ring),
+            ]
+        )
+        return rows, cols
+
+    def nearest(
+        self,
+        latitude: np.ndarray[Any, Any],
+        longitude: np.ndarray[Any, Any],
+        *,
+        max_distance: float = 10_000,
+        chunk_size: int = 50_000,
+    ) -> tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+        """
+        Find the nearest postcode to each point (in degrees).
+        Returns the postcode keys (-1 if nothing within max_distance metres)
+        and the distances in metres.
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        keys = np.full(len(latitude), -1, dtype=np.int64)
+        distances = np.full(len(latitude), np.nan)
+        for start in range(0, len(latitude), chunk_size):
+            end = start + chunk_size
+            keys[start:end], distances[start:end] = self._nearest_chunk(
+                latitude[start:end],
+                longitude[start:end],
+                max_distance=max_distance,
+            )
+        return keys, distances
+
+    def _nearest_chunk(
+        self,
+        latitude: np.ndarray[Any, Any],
+        longitude: np.ndarray[Any, Any],
+        *,
+        max_distance: float,
+    ) -> tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+        scale = self.scale
+        metres_per_unit = METRES_PER_DEGREE / scale
+        point_latitude = latitude * scale
+        point_longitude = longitude * scale
+        point_cos = np.cos(np.radians(latitude))
+
+        finite = np.isfinite(point_latitude) & np.isfinite(point_longitude)
+        rows = np.zeros(len(latitude), dtype=np.int64)
+        cols = np.zeros(len(latitude), dtype=np.int64)
+        rows[finite] = np.floor(
+            (point_latitude[finite] - self.origin_latitude) / self.cell_latitude
+        )
+        cols[finite] = np.floor(
+            (point_longitude[finite] - self.origin_longitude) / self.cell_longitude
+        )
+
+        best = np.full(len(latitude), -1, dtype=np.int64)
+        best_squared = np.full(len(latitude), np.inf)
+        pending = np.flatnonzero(finite)
+
+        # skip points further than max_distance from the grid's bounding box
+        box_latitude = np.clip(
+            point_latitude[pending],
+            self.origin_latitude,
+            self.origin_latitude + self.row_count * self.cell_latitude,
+        )
+        box_longitude = np.clip(
+            point_longitude[pending],
+            self.origin_longitude,
+            self.origin_longitude + self.column_count * self.cell_longitude,
+        )
+        box_squared = (
+            (point_latitude[pending] - box_latitude) ** 2
+            + ((point_longitude[pending] - box_longitude) * point_cos[pending]) ** 2
+        ) * metres_per_unit**2
+        pending = pending[box_squared <= max_distance**2]
+
+        # by this ring every cell in the grid has been searched
+        last_ring = np.maximum.reduce(
+            [rows, self.row_count - 1 - rows, cols, self.column_count - 1 - cols]
+        )
+
+        ring = 0
+        while len(pending):
+            row_offsets, col_offsets = self.ring_offsets(ring)
+            cell_rows = rows[pending, None] + row_offsets
+            cell_cols = cols[pending, None] + col_offsets
+            in_grid = (
+                (cell_rows >= 0)
+                & (cell_rows < self.row_count)
+                & (cell_cols >= 0)
+                & (cell_cols < self.column_count)
+            )
+            cells = cell_rows * self.column_count + cell_cols
+            position = np.minimum(
+                np.searchsorted(self.cell_ids, cells), len(self.cell_ids) - 1
+            )
+            hit = in_grid & (self.cell_ids[position] == cells)
+            starts = np.where(hit, self.cell_starts[position], 0).ravel()
+            counts = np.where(hit, self.cell_starts[position + 1], 0).ravel() - starts
+
+            total = int(counts.sum())
+            if total:
+                # one entry per candidate postcode, grouped by point
+                point = np.repeat(
+                    np.repeat(np.arange(len(pending)), len(row_offsets)), counts
+                )
+                offset_in_cell = np.arange(total) - np.repeat(
+                    np.cumsum(counts) - counts, counts
+                )
+                candidates = np.repeat(starts, counts) + offset_in_cell
+                dy = self.latitude[candidates] - point_latitude[pending][point]
+                dx = (
+                    self.longitude[candidates] - point_longitude[pending][point]
+                ) * point_cos[pending][point]
+                squared = (dx * dx + dy * dy) * metres_per_unit**2
+
+                # closest candidate for each point
+                group_starts = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+                group_points = point[group_starts]
+                group_min = np.minimum.reduceat(squared, group_starts)
+                group_counts = np.diff(np.append(group_starts, total))
+                is_min = squared == np.repeat(group_min, group_counts)
+                _, first_min = np.unique(point[is_min], return_index=True)
+                group_best = candidates[np.flatnonzero(is_min)[first_min]]
+
+                targets = pending[group_points]
+                better = group_min < best_squared[targets]
+                best_squared[targets[better]] = group_min[better]
+                best[targets[better]] = group_best[better]
+
+            # anything not yet searched is at least this far away
+            far_latitude = np.minimum(
+                np.abs(latitude[pending]) + (ring + 1) * self.cell_latitude / scale,
+                89.0,
+            )
+            searched = ring * np.minimum(
+                self.cell_latitude * metres_per_unit,
+                self.cell_longitude
+                * metres_per_unit
+                * np.cos(np.radians(far_latitude)),
+            )
+            done = (
+                (best_squared[pending] <= searched**2)
+                | (searched >= max_distance)
+                | (ring >= last_ring[pending])
+            )
+            pending = pending[~done]
+            ring += 1
+
+        distances = np.sqrt(best_squared)
+        found = (best >= 0) & (distances <= max_distance)
+        distances[~found] = np.nan
+        keys = np.full(len(best), -1, dtype=np.int64)
+        keys[found] = self.postcode_keys[best[found]]
+        return keys, distances
+
+    @classmethod
+    def from_binary(cls, path: Path):
+        arrays, meta = read_arrays(path)
+        return cls(
+            cell_ids=arrays["cell_ids"],
+            cell_starts=arrays["cell_starts"],
+            postcode_keys=arrays["postcode_keys"],
+            latitude=arrays["latitude"],
+            longitude=arrays["longitude"],
+            meta=meta,
+        )
+
+    @classmethod
+    def from_data_folder(cls):
+        return cls.from_binary(generated_file("postcode_grid.bin"))
+
+
 class MiniPostcodeLookup:
-    def __init__(self, preload: list[AllowedAreaTypes] = []):
-        self.lookups: dict[AllowedAreaTypes, PostcodeRangeLookup] = {}
+    def __init__(
+        self, preload: list[AllowedAreaTypes] = [], reject_unknown: bool = False
+    ):
+        """
+        If reject_unknown is True, postcodes that are not in the full postcode
+        list return None rather than the value of the range they fall in.
+        """
+        self.reject_unknown = reject_unknown
+        self.membership: Optional[PostcodeMembership] = None
+        self.coordinates: Optional[PostcodeCoordinates] = None
+        self.grid: Optional[PostcodeGrid] = None
+        self.lookups: dict[AreaType, PostcodeRangeLookup] = {}
+        self.parents: dict[AllowedAreaTypes, ParentLookup] = {}
+        # nested area type -> child area type it is resolved through
+        self.derived: dict[AreaType, AllowedAreaTypes] = {}
         for area_type in preload:
             self.check_and_load_area(area_type)
 
-    def check_and_load_area(self, area_type: AllowedAreaTypes):
-        if area_type not in self.lookups:
+    def check_and_load_area(self, area_type: AreaType):
+        if area_type in self.lookups or area_type in self.derived:
+            return
+
+        child = nested_area_types.get(area_type)
+        if child is None:
             self.lookups[area_type] = PostcodeRangeLookup.from_area_type(area_type)
+            return
+
+        if child not in self.parents:
+            self.parents[child] = ParentLookup.from_area_type(child)
+        if not self.parents[child].has_parent(area_type):
+            raise ValueError(
+                f"The {child} parent map has no {area_type} values. "
+                "Run `python -m mini_postcode_lookup generate-lookups --force` to recreate it."
+            )
+        self.check_and_load_area(child)
+        if self.parents[child].child_count != len(self.lookups[child].value_values):
+            raise ValueError(
+                f"The {child} parent map does not match the {child} lookup. "
+                "Run `python -m mini_postcode_lookup generate-lookups --force` to recreate it."
+            )
+        self.derived[area_type] = child
 
-    def get_multiple_values(self, postcode: str, *, area_types: list[AllowedAreaTypes]):
-        return {
-            area_type: self.get_value(postcode, area_type=area_type)
-            for area_type in area_types
-        }
+    def check_and_load_membership(self) -> PostcodeMembership:
+        if self.membership is None:
+            self.membership = PostcodeMembership.from_data_folder()
+        return self.membership
+
+    def postcode_exists(self, postcode: str) -> bool:
+        """
+        Check a postcode is in the full postcode list
+        """
+        return self.check_and_load_membership().contains(postcode)
+
+    def postcodes_exist(self, series: Series) -> Series:
+        """
+        Vectorised postcode_exists
+        """
+        membership = self.check_and_load_membership()
+        found = membership.contains_many(postcodes_to_ints(series))
+        return pd.Series(found, index=series.index, name="postcode_exists")
+
+    def check_and_load_coordinates(self) -> PostcodeCoordinates:
+        if self.coordinates is None:
+            membership = self.check_and_load_membership()
+            self.coordinates = PostcodeCoordinates.from_data_folder()
+            if len(self.coordinates) != len(membership):
+                raise ValueError("Coordinates do not match the postcode list")
+        return self.coordinates
+
+    def get_coordinates(self, postcode: str) -> Optional[Coordinates]:
+        """
+        Get the centroid of a postcode
+        """
+        coordinates = self.check_and_load_coordinates()
+        membership = self.check_and_load_membership()
+        if not check_real_postcode(postcode):
+            return None
+        return coordinates.get(membership.index_of(postcode_to_int(postcode)))
+
+    def get_coordinates_series(self, series: Series) -> pd.DataFrame:
+        """
+        Get the centroids of a series of postcodes, as a dataframe with
+        latitude, longitude, easting and northing columns
+        """
+        coordinates = self.check_and_load_coordinates()
+        membership = self.check_and_load_membership()
+        indexes = membership.index_of_many(postcodes_to_ints(series))
+        df = coordinates.get_many(indexes)
+        df.index = series.index
+        return df
+
+    def check_and_load_grid(self) -> PostcodeGrid:
+        if self.grid is None:
+            self.grid = PostcodeGrid.from_data_folder()
+        return self.grid
+
+    def nearest_postcodes(
+        self,
+        latitude: Union[Series, np.ndarray[Any, Any], list[float]],
+        longitude: Union[Series, np.ndarray[Any, Any], list[float]],
+        *,
+        area_types: list[AllowedAreaTypes] = [],
+        max_distance: float = 10_000,
+    ) -> pd.DataFrame:
+        """
+        Find the nearest live postcode to each point.
+        Returns a dataframe with postcode and distance (metres) columns,
+        plus a column for each area type of the nearest postcode.
+        Points with no postcode within max_distance metres get None.
+        """
+        grid = self.check_and_load_grid()
+        int_postcodes, distances = grid.nearest(
+            np.asarray(latitude, dtype=np.float64),
+            np.asarray(longitude, dtype=np.float64),
+            max_distance=max_distance,
+        )
+        found = int_postcodes >= 0
+
+        postcodes = np.full(len(int_postcodes), None, dtype=object)
+        unique_ints, inverse = np.unique(int_postcodes[found], return_inverse=True)
+        postcodes[found] = np.array(
+            [int_to_postcode(int(x)) for x in unique_ints], dtype=object
+        )[inverse]
+
+        df = pd.DataFrame({"postcode": postcodes, "distance": distances})
+        if isinstance(latitude, pd.Series):
+            df.index = latitude.index
+        for area_type in area_types:
+            df[str(area_type)] = self.get_values_from_ints(
+                int_postcodes, area_type=area_type
+            )
+        return df
+
+    def nearest_postcode(
+        self, latitude: float, longitude: float, *, max_distance: float = 10_000
+    ) -> Optional[NearestPostcode]:
+        """
+        Find the nearest live postcode to a point
+        """
+        df = self.nearest_postcodes([latitude], [longitude], max_distance=max_distance)
+        postcode = df["postcode"].iloc[0]
+        if postcode is None:
+            return None
+        return NearestPostcode(
+            postcode=postcode, distance=float(df["distance"].iloc[0])
+        )
+
+    def get_multiple_values(self, postcode: str, *, area_types: list[AreaType]):
+        """
+        Get several area types for a postcode.
+        Nested area types share one search of the child lookup.
+        """
+        if self.reject_unknown and not self.postcode_exists(postcode):
+            return {area_type: None for area_type in area_types}
+        child_indexes: dict[AllowedAreaTypes, Optional[int]] = {}
+        result: dict[AreaType, Optional[str]] = {}
+        for area_type in area_types:
+            self.check_and_load_area(area_type)
+            child = self.derived.get(area_type)
+            if child is None:
+                result[area_type] = self.lookups[area_type].get_value(postcode)
+                continue
+            if child not in child_indexes:
+                child_indexes[child] = self.lookups[child].get_index(postcode)
+            result[area_type] = self.parents[child].get_value(
+                child_indexes[child], area_type
+            )
+        return result
 
     def add_to_csv(
         self,
@@ -222,24 +1023,154 @@ class MiniPostcodeLookup:
         """
         Add a column to a csv with the area type
         """
-
-        dest_path = file_loc.parent / f"{file_loc.stem}_with_{area_type}.csv"
-
-        df = pd.read_csv(file_loc)  # type: ignore
-        df = self.add_to_df(
-            df,
+        self.add_to_file(
+            file_loc,
             area_type=area_type,
             postcode_col=postcode_col,
             include_extra_cols=include_extra_cols,
             include_imd=include_imd,
             imd_nation=imd_nation,
+            remove_postcode=remove_postcode,
+            file_format=FileFormat.CSV,
         )
 
-        if remove_postcode:
-            df = df.drop(columns=[postcode_col])
+    def add_to_file(
+        self,
+        file_loc: Path,
+        *,
+        area_type: AllowedAreaTypes = AllowedAreaTypes.PCON_2024,
+        postcode_col: str = "postcode",
+        include_extra_cols: bool = False,
+        include_imd: IMDInclude = IMDInclude.NONE,
+        imd_nation: IMDNation = IMDNation.E,
+        remove_postcode: bool = False,
+        file_format: Optional[FileFormat] = None,
+        dest_path: Optional[Path] = None,
+    ) -> Path:
+        """
+        Add a column to a csv, parquet or feather file with the area type.
+        The format is taken from the file extension unless given.
+
+        For parquet and feather, only the postcode column is read for the lookup,
+        and the new columns are appended to the output batch by batch.
+        """
+        if file_format is None:
+            file_format = FileFormat.from_path(file_loc)
+
+        if dest_path is None:
+            dest_path = (
+                file_loc.parent / f"{file_loc.stem}_with_{area_type}{file_loc.suffix}"
+            )
+
+        options = {
+            "area_type": area_type,
+            "postcode_col": postcode_col,
+            "include_extra_cols": include_extra_cols,
+            "include_imd": include_imd,
+            "imd_nation": imd_nation,
+        }
+
+        if file_format == FileFormat.CSV:
+            df = pd.read_csv(file_loc)  # type: ignore
+            df = self.add_to_df(df, **options)  # type: ignore
+            if remove_postcode:
+                df = df.drop(columns=[postcode_col])
+            df.to_csv(dest_path, index=False)
+        else:
+            self._add_to_columnar_file(
+                file_loc,
+                dest_path,
+                file_format=file_format,
+                remove_postcode=remove_postcode,
+                **options,  # type: ignore
+            )
 
-        df.to_csv(dest_path, index=False)
         rich.print(f"[green]File created at {dest_path}[/green]")
+        return dest_path
+
+    def _add_to_columnar_file(
+        self,
+        file_loc: Path,
+        dest_path: Path,
+        *,
+        file_format: FileFormat,
+        remove_postcode: bool,
+        postcode_col: str,
+        **options: Any,
+    ):
+        """
+        Read only the postcode column, work out the new columns, then copy
+        the source across a row group (or record batch) at a time with
+        the new columns attached.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "Parquet and Feather files need pyarrow, install with "
+                "`pip install mini-postcode-lookup[parquet]`"
+            ) from e
+
+        if file_format == FileFormat.PARQUET:
+            postcode_table = pq.read_table(file_loc, columns=[postcode_col])
+        else:
+            postcode_table = feather.read_table(
+                file_loc, columns=[postcode_col], memory_map=True
+            )
+
+        postcode_df = postcode_table.to_pandas()
+        new_df = self.add_to_df(postcode_df, postcode_col=postcode_col, **options)
+        if len(new_df) != len(postcode_df):
+            raise ValueError("Lookup changed the number of rows")
+        new_df = new_df.drop(columns=[postcode_col])
+        new_df.columns = [str(x) for x in new_df.columns]
+        new_columns = pa.Table.from_pandas(new_df, preserve_index=False)
+
+        def extend(batch: pa.Table, offset: int) -> pa.Table:
+            if remove_postcode:
+                batch = batch.drop_columns([postcode_col])
+            extra = new_columns.slice(offset, batch.num_rows)
+            for name, column in zip(extra.column_names, extra.columns):
+                # replace an existing column of the same name, as with csv
+                if name in batch.column_names:
+                    index = batch.column_names.index(name)
+                    batch = batch.set_column(index, name, column)
+                else:
+                    batch = batch.append_column(name, column)
+            return batch
+
+        offset = 0
+        if file_format == FileFormat.PARQUET:
+            source = pq.ParquetFile(file_loc)
+            # keep the source's codec (pyarrow's default is snappy)
+            compression = "snappy"
+            if source.metadata.num_row_groups and source.metadata.num_columns:
+                codec = source.metadata.row_group(0).column(0).compression
+                compression = "none" if codec == "UNCOMPRESSED" else codec.lower()
+            with pq.ParquetWriter(
+                dest_path,
+                extend(source.schema_arrow.empty_table(), 0).schema,
+                compression=compression,
+            ) as writer:
+                for i in range(source.num_row_groups):
+                    batch = source.read_row_group(i)
+                    writer.write_table(extend(batch, offset))
+                    offset += batch.num_rows
+        else:
+            with pa.memory_map(str(file_loc)) as source_file:
+                source = pa.ipc.open_file(source_file)
+                schema = extend(source.schema.empty_table(), 0).schema
+                # compressed as feather.write_feather does by default
+                options = pa.ipc.IpcWriteOptions(
+                    compression="lz4" if pa.Codec.is_available("lz4") else None
+                )
+                with pa.ipc.new_file(str(dest_path), schema, options=options) as writer:
+                    for i in range(source.num_record_batches):
+                        batch = pa.Table.from_batches([source.get_batch(i)])
+                        writer.write_table(extend(batch, offset))
+                        offset += batch.num_rows
 
     def get_series(
         self,
@@ -290,9 +1221,7 @@ class MiniPostcodeLookup:
         """
         Add a column to a dataframe with the area type
         """
-        df[area_type] = df[postcode_col].apply(  # type: ignore
-            lambda x: self.get_value(x, area_type=area_type)  # type: ignore
-        )
+        df[area_type] = self.get_values(df[postcode_col], area_type=area_type)
 
         if area_type in areas_with_lookups and include_extra_cols:
             lookup_df = load_lookup(area_type)
@@ -314,6 +1243,57 @@ class MiniPostcodeLookup:
 
         return df
 
-    def get_value(self, postcode: str, *, area_type: AllowedAreaTypes):
+    def get_values(self, series: Series, *, area_type: AreaType) -> Series:
+        """
+        Vectorised get_value for a series of postcodes
+        """
+        int_postcodes = postcodes_to_ints(series)
+        if self.reject_unknown:
+            membership = self.check_and_load_membership()
+            int_postcodes[~membership.contains_many(int_postcodes)] = -1
+
+        values = self.get_values_from_ints(int_postcodes, area_type=area_type)
+        return pd.Series(values, index=series.index, name=str(area_type))
+
+    def get_values_from_ints(
+        self, int_postcodes: np.ndarray[Any, Any], *, area_type: AreaType
+    ) -> np.ndarray[Any, Any]:
+        """
+        Vectorised get_value for postcodes already converted with postcodes_to_ints
+        """
         self.check_and_load_area(area_type)
+        child = self.derived.get(area_type)
+        if child is not None:
+            child_indexes = self.lookups[child].get_indexes(int_postcodes)
+            return self.parents[child].get_values(child_indexes, area_type)
+        return self.lookups[area_type].get_values(int_postcodes)
+
+    def get_value(self, postcode: str, *, area_type: AreaType):
+        self.check_and_load_area(area_type)
+        if self.reject_unknown and not self.postcode_exists(postcode):
+            return None
+        child = self.derived.get(area_type)
+        if child is not None:
+            child_index = self.lookups[child].get_index(postcode)
+            return self.parents[child].get_value(child_index, area_type)
         return self.lookups[area_type].get_value(postcode)
+
+
+def lookup_values(
+    lookup: MiniPostcodeLookup,
+    postcodes: list[str],
+    area_types: list[AllowedAreaTypes],
+    reject_unknown: bool = False,
+) -> dict[str, list[Optional[str]]]:
+    """
+    Batch lookup of several area types, with missing values as None
+    """
+    series = pd.Series(postcodes, dtype=object)
+    exists = lookup.postcodes_exist(series) if reject_unknown else None
+    result: dict[str, list[Optional[str]]] = {}
+    for area_type in area_types:
+        values = lookup.get_values(series, area_type=area_type)
+        if exists is not None:
+            values[~exists] = None
+        result[str(area_type)] = [x if isinstance(x, str) else None for x in values]
+    return result
@@ -0,0 +1,154 @@
+"""
+Use the lookups from SQL.
+
+Registers a `postcode_area(postcode, area_type)` function in DuckDB
+(vectorised, over Arrow batches) or SQLite (row by row), and can export
+the range tables for ASOF joins against `postcode_key(postcode)`.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from .process import (
+    AllowedAreaTypes,
+    AreaType,
+    MiniPostcodeLookup,
+    NestedAreaTypes,
+    check_real_postcode,
+    index_array_to_values,
+    postcode_to_int,
+    postcodes_to_ints,
+)
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    import duckdb
+
+
+def range_table(
+    area_type: AreaType, lookup: Optional[MiniPostcodeLookup] = None
+) -> pd.DataFrame:
+    """
+    The range table for an area type as a dataframe of the first postcode_key
+    of each range and its value, for joining with an ASOF join on postcode_key.
+    """
+    if lookup is None:
+        lookup = MiniPostcodeLookup()
+    lookup.check_and_load_area(area_type)
+
+    child = lookup.derived.get(area_type)
+    source = lookup.lookups[child or area_type]
+    keys = np.frombuffer(source.postcode_keys, dtype=np.int64)
+    indexes = source.get_indexes(keys)
+    if child is not None:
+        values = lookup.parents[child].get_values(indexes, area_type)
+    else:
+        values = index_array_to_values(indexes, source.value_values)
+
+    values = [x if isinstance(x, str) else None for x in values]
+    return pd.DataFrame({"postcode_key": keys, str(area_type): values})
+
+
+def _area_type(value: str) -> AreaType:
+    """
+    Area type from its name in SQL, including nested types such as region
+    """
+    if value in NestedAreaTypes.__members__.values():
+        return NestedAreaTypes(value)
+    return AllowedAreaTypes(value)
+
+
+def _area_values(
+    lookup: MiniPostcodeLookup, postcodes: pd.Series, area_types: pd.Series
+) -> list[Optional[str]]:
+    """
+    Vectorised lookup where the area type can vary by row
+    """
+    result = pd.Series(None, index=postcodes.index, dtype=object)
+    for area_type in area_types.dropna().unique():  # type: ignore
+        rows = area_types == area_type
+        result[rows] = lookup.get_values(
+            postcodes.loc[rows], area_type=_area_type(area_type)
+        )
+    return [x if isinstance(x, str) else None for x in result]
+
+
+def register_duckdb(
+    connection: duckdb.DuckDBPyConnection,
+    lookup: Optional[MiniPostcodeLookup] = None,
+    *,
+    name: str = "postcode_area",
+    key_name: str = "postcode_key",
+):
+    """
+    Register `postcode_area(postcode, area_type)` and `postcode_key(postcode)`
+    as vectorised (Arrow) functions on a DuckDB connection.
+
+    postcode_key gives -1 for invalid postcodes.
+    """
+    import pyarrow as pa
+    from duckdb.func import FunctionNullHandling, PythonUDFType
+
+    if lookup is None:
+        lookup = MiniPostcodeLookup()
+
+    # duckdb resolves these annotations at runtime, so they can't use pa
+    def postcode_area(postcodes: Any, area_types: Any) -> Any:
+        values = _area_values(
+            lookup,
+            postcodes.to_pandas(),  # type: ignore
+            area_types.to_pandas(),  # type: ignore
+        )
+        return pa.array(values, type=pa.string())
+
+    def postcode_key(postcodes: Any) -> Any:
+        return pa.array(postcodes_to_ints(postcodes.to_pandas()), type=pa.int64())  # type: ignore
+
+    # unknown postcodes give NULL, so null handling has to be 'special'
+    connection.create_function(
+        name,
+        postcode_area,
+        ["VARCHAR", "VARCHAR"],
+        "VARCHAR",
+        type=PythonUDFType.ARROW,
+        null_handling=FunctionNullHandling.SPECIAL,
+    )
+    connection.create_function(
+        key_name, postcode_key, ["VARCHAR"], "BIGINT", type=PythonUDFType.ARROW
+    )
+
+
+def register_sqlite(
+    connection: sqlite3.Connection,
+    lookup: Optional[MiniPostcodeLookup] = None,
+    *,
+    name: str = "postcode_area",
+    key_name: str = "postcode_key",
+):
+    """
+    Register `postcode_area(postcode, area_type)` and `postcode_key(postcode)`
+    on a SQLite connection. SQLite calls these once per row.
+
+    postcode_key gives -1 for invalid postcodes.
+    """
+    if lookup is None:
+        lookup = MiniPostcodeLookup()
+
+    def postcode_area(postcode: Any, area_type: Any) -> Optional[str]:
+        if area_type is None:
+            return None
+        value = lookup.get_value(postcode, area_type=_area_type(area_type))
+        return value if isinstance(value, str) else None
+
+    def postcode_key(postcode: Any) -> int:
+        if not check_real_postcode(postcode):
+            return -1
+        return postcode_to_int(postcode)
+
+    connection.create_function(name, 2, postcode_area, deterministic=True)
+    connection.create_function(key_name, 1, postcode_key, deterministic=True)
@@ -0,0 +1,67 @@
+// Headless check of the browser client.
+// Loads docs/lookup_worker.js in a sandbox with a fake worker global,
+// converts a column of a csv and prints the values as JSON.
+// A first conversion is superseded by the second, so should give no result.
+//
+// usage: node convert_postcodes.js <table.bin> <postcodes.csv> <column>
+
+const fs = require("fs");
+const path = require("path");
+const vm = require("vm");
+
+const docsFolder = path.join(__dirname, "..", "..", "docs");
+const [binPath, csvPath, column] = process.argv.slice(2);
+
+const readColumn = (csvPath, column) => {
+    const lines = fs.readFileSync(csvPath, "utf8").split(/\r?\n/).filter(x => x.length > 0);
+    const index = lines[0].split(",").indexOf(column);
+    if (index === -1) {
+        throw new Error(`Column ${column} not found`);
+    }
+    return lines.slice(1).map(line => line.split(",")[index]);
+};
+
+const messages = [];
+const sandbox = {
+    console: console,
+    TextDecoder: TextDecoder,
+    setTimeout: setTimeout,
+    postMessage: (message) => messages.push(message),
+    importScripts: (name) => {
+        vm.runInContext(fs.readFileSync(path.join(docsFolder, name), "utf8"), sandbox);
+    },
+    fetch: async (url) => ({
+        arrayBuffer: async () => {
+            const data = fs.readFileSync(url);
+            return data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+        },
+    }),
+};
+sandbox.self = sandbox;
+vm.createContext(sandbox);
+vm.runInContext(fs.readFileSync(path.join(docsFolder, "lookup_worker.js"), "utf8"), sandbox);
+
+const main = async () => {
+    await sandbox.onmessage({ data: { type: "load", url: binPath } });
+    const postcodes = readColumn(csvPath, column);
+    const superseded = sandbox.onmessage({ data: { type: "convert", id: 1, postcodes: postcodes } });
+    await sandbox.onmessage({ data: { type: "convert", id: 2, postcodes: postcodes } });
+    await superseded;
+
+    const errors = messages.filter(m => m.type === "error");
+    if (errors.length > 0) {
+        throw new Error(errors[0].message);
+    }
+    const progress = messages.filter(m => m.type === "progress" && m.id === 2);
+    const results = messages.filter(m => m.type === "result");
+    process.stdout.write(JSON.stringify({
+        progress: progress.map(m => m.done),
+        result_ids: results.map(m => m.id),
+        values: results[0].values,
+    }));
+};
+
+main().catch(error => {
+    console.error(error);
+    process.exit(1);
+});
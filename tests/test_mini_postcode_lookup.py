@@ -1,34 +1,649 @@
-from mini_postcode_lookup import MiniPostcodeLookup, generate
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+from typer.testing import CliRunner
+
+from mini_postcode_lookup import (
+    AllowedAreaTypes,
+    MiniPostcodeLookup,
+    NestedAreaTypes,
+    PostcodeRangeLookup,
+    client,
+    daemon,
+    generate,
+    process,
+    sql,
+)
+from mini_postcode_lookup.cli import app
 
 
 def test_postcode_validity():
     """
     Check generated postcodes against the original source data
     """
-    creators = [
-        generate.FutureConstituenciesLookupCreator(),
-        generate.LocalAuthoritiesLookupCreator(),
-        generate.PCONLookupCreator(),
-        generate.LSOALookupCreator(),
-    ]
-
     plookup = MiniPostcodeLookup()
 
-    for creator in creators:
+    for creator in generate.range_creators:
         df = creator.get_df(test=True)
-        df.columns = ["postcode", "original_value"]
-        # reduce to random 10000
-        df["new_value"] = df["postcode"].apply(  # type: ignore
-            lambda x: plookup.get_value(x, area_type=creator.slug)  # type: ignore
-        )  # type: ignore
-        df["match"] = df["original_value"] == df["new_value"]
-        # reduce just to those where the new_value is not None
-        df = df[df["new_value"].notnull()]
-
-        # df.to_csv("test.csv")
+        result = creator.verify(test=True, df=df)
 
         # assert there is a length
-        assert len(df) > 0
+        assert result.checked > 0
 
         # assert the new_value is the same as the old one
-        assert df["match"].all()  # type: ignore
+        assert result.ok, result.mismatches.head()
+
+        # and through the public lookup, for a random 1000
+        df = df[df[creator.postcode_col].apply(process.check_real_postcode)]  # type: ignore
+        df = df.sample(1000, random_state=0)
+        area_type = AllowedAreaTypes(creator.slug)
+        new_value = df[creator.postcode_col].apply(  # type: ignore
+            lambda x: plookup.get_value(x, area_type=area_type)  # type: ignore
+        )
+        assert new_value.equals(
+            plookup.get_values(df[creator.postcode_col], area_type=area_type)  # type: ignore
+        )
+        original = df[creator.value_col]
+        assert ((new_value == original) | (new_value.isna() & original.isna())).all()
+
+
+def test_binary_round_trip(tmp_path: Path):
+    """
+    Check the binary table format stores the same table as the json
+    """
+    dest = tmp_path / "local_authorities.bin"
+    generate.export_browser_table("local_authorities", dest)
+
+    original = PostcodeRangeLookup.from_area_type("local_authorities")
+    from_binary = PostcodeRangeLookup.from_binary(dest)
+
+    assert from_binary.postcode_keys == original.postcode_keys
+    assert from_binary.value_key == original.value_key
+    assert from_binary.value_values == [
+        x if isinstance(x, str) else None for x in original.value_values
+    ]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+def test_browser_client(tmp_path: Path):
+    """
+    Run the browser worker under node and compare with the python lookup
+    """
+    dest = tmp_path / "local_authorities.bin"
+    generate.export_browser_table("local_authorities", dest)
+
+    creator = generate.LocalAuthoritiesLookupCreator()
+    script = Path(__file__).parent / "js" / "convert_postcodes.js"
+    result = subprocess.run(
+        [
+            "node",
+            str(script),
+            str(dest),
+            str(creator.test_df_source),
+            creator.postcode_col,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    output = json.loads(result.stdout)
+
+    df = creator.get_df(test=True)
+    plookup = PostcodeRangeLookup.from_area_type("local_authorities")
+    # the browser client excludes NI postcodes, and stores missing values as null
+    expected = [
+        None if postcode.startswith("BT") else plookup.get_value(postcode)
+        for postcode in df[creator.postcode_col]
+    ]
+    expected = [x if isinstance(x, str) else None for x in expected]
+
+    assert output["values"] == expected
+    assert output["progress"][-1] == len(df)
+    # the first conversion was superseded by the second
+    assert output["result_ids"] == [2]
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".feather"])
+def test_add_to_file(tmp_path: Path, suffix: str):
+    """
+    Check csv, parquet and feather files get the same new column
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    df = pd.read_csv("data/onspd_100000.csv", nrows=5000)  # type: ignore
+    # an existing column with the same name is replaced
+    df["local_authorities"] = "old value"
+    source = tmp_path / f"source{suffix}"
+    if suffix == ".csv":
+        df.to_csv(source, index=False)
+    elif suffix == ".parquet":
+        # small row groups to check the new column lines up across them
+        df.to_parquet(source, index=False, row_group_size=1000, compression="zstd")
+    else:
+        df.to_feather(source, chunksize=1000)
+
+    plookup = MiniPostcodeLookup()
+    dest = plookup.add_to_file(
+        source,
+        area_type=AllowedAreaTypes.LOCAL_AUTHORITIES,
+        postcode_col="pcd",
+        remove_postcode=True,
+    )
+    assert dest.name == f"source_with_local_authorities{suffix}"
+
+    if suffix == ".csv":
+        result = pd.read_csv(dest)  # type: ignore
+    elif suffix == ".parquet":
+        result = pd.read_parquet(dest)
+        metadata = pq.ParquetFile(dest).metadata
+        assert metadata.row_group(0).column(0).compression == "ZSTD"
+    else:
+        result = pd.read_feather(dest)
+        # compressed, like the source
+        uncompressed = tmp_path / "uncompressed.feather"
+        result.to_feather(uncompressed, chunksize=1000, compression="uncompressed")
+        assert dest.stat().st_size < uncompressed.stat().st_size
+
+    expected = df["pcd"].apply(  # type: ignore
+        lambda x: plookup.get_value(x, area_type=AllowedAreaTypes.LOCAL_AUTHORITIES)  # type: ignore
+    )
+    assert list(result.columns) == ["oslaua", "pcon", "lsoa11", "local_authorities"]
+    assert result["local_authorities"].equals(expected)  # type: ignore
+
+
+def test_nested_area_types(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Check nested area types worked out from the LSOA lookup
+    match the source data, and don't replace exact range tables
+    """
+    shutil.copy(
+        process.data_folder / "local_authorities.json",
+        tmp_path / "local_authorities.json",
+    )
+    monkeypatch.setattr(process, "data_folder", tmp_path)
+
+    plookup = MiniPostcodeLookup()
+    with pytest.raises(FileNotFoundError, match="generate-lookups"):
+        plookup.get_value("W1K 3RH", area_type=NestedAreaTypes.REGION)
+
+    creator = generate.LSOALookupCreator()
+    df = pd.read_csv(creator.test_df_source)  # type: ignore
+    df = df[df["lsoa11"].notnull()]
+    # the sample has no region column, so use the country letter of the LSOA
+    # code, which LSOAs nest in exactly
+    df["rgn"] = df["lsoa11"].str[0]
+    generate.create_range(
+        df[["pcd", "lsoa11"]].copy(),  # type: ignore
+        postcode_col="pcd",
+        value_col="lsoa11",
+        output_label="lsoa",
+        dest=tmp_path / "lsoa.json",
+    )
+    lsoa_values = PostcodeRangeLookup.from_area_type("lsoa").value_values
+    generate.create_parent_map(
+        df,
+        child_col="lsoa11",
+        parent_cols={"region": "rgn"},
+        child_values=lsoa_values,
+        child_label="lsoa",
+        dest=tmp_path / "lsoa_parents.bin",
+    )
+
+    plookup = MiniPostcodeLookup()
+    df = df[df["pcd"].apply(process.check_real_postcode)]  # type: ignore
+    region = plookup.get_values(df["pcd"], area_type=NestedAreaTypes.REGION)
+    assert (region == df["rgn"]).all()
+    assert plookup.derived == {NestedAreaTypes.REGION: AllowedAreaTypes.LSOA}
+
+    # local authorities stay on their own table
+    local_authorities = plookup.get_values(
+        df["pcd"], area_type=AllowedAreaTypes.LOCAL_AUTHORITIES
+    )
+    assert AllowedAreaTypes.LOCAL_AUTHORITIES in plookup.lookups
+    assert (local_authorities == df["oslaua"]).all()
+
+    monkeypatch.setattr(generate, "dest_folder", tmp_path)
+    (result,) = generate.ParentLookupCreator().verify(df=df)
+    assert result.slug == "region"
+    assert result.checked == len(df)
+    assert result.ok
+
+    # built from the source, which is filtered on the postcode column
+    source = tmp_path / "source.csv"
+    df.to_csv(source, index=False)
+    monkeypatch.setattr(generate.LSOALookupCreator, "df_source", source)
+    monkeypatch.setattr(generate, "LIMIT_NI", True)
+    creator = generate.ParentLookupCreator()
+    assert not creator.get_df()["pcd"].str.startswith("BT").any()  # type: ignore
+    creator.create(force=True)
+
+    values = plookup.get_multiple_values(
+        "W1K 3RH",
+        area_types=[
+            AllowedAreaTypes.LSOA,
+            AllowedAreaTypes.LOCAL_AUTHORITIES,
+            NestedAreaTypes.REGION,
+        ],
+    )
+    assert values == {
+        AllowedAreaTypes.LSOA: "E01004761",
+        AllowedAreaTypes.LOCAL_AUTHORITIES: "E09000033",
+        NestedAreaTypes.REGION: "E",
+    }
+
+    # nested types work from SQL too
+    query = "select postcode_area('W1K 3RH', 'region')"
+    connection = sqlite3.connect(":memory:")
+    sql.register_sqlite(connection, plookup)
+    assert connection.execute(query).fetchone() == ("E",)
+    duckdb_connection = duckdb.connect()
+    sql.register_duckdb(duckdb_connection, plookup)
+    assert duckdb_connection.execute(query).fetchone() == ("E",)
+
+    # a parent map made from a different LSOA lookup is refused
+    generate.create_range(
+        df[["pcd", "lsoa11"]][:1000].copy(),  # type: ignore
+        postcode_col="pcd",
+        value_col="lsoa11",
+        output_label="lsoa",
+        dest=tmp_path / "lsoa.json",
+    )
+    with pytest.raises(ValueError, match="generate-lookups --force"):
+        MiniPostcodeLookup().get_value("W1K 3RH", area_type=NestedAreaTypes.REGION)
+
+
+def test_vectorised_lookup():
+    """
+    Check batch lookups match single lookups, including invalid postcodes
+    """
+    df = pd.read_csv("data/onspd_100000.csv", nrows=5000)  # type: ignore
+    postcodes = pd.concat(
+        [df["pcd"], pd.Series(["not a postcode", None, 12, "aa1 1aa", "A1 1AA"])],
+        ignore_index=True,
+    )
+    plookup = MiniPostcodeLookup()
+    for area_type in [AllowedAreaTypes.PCON_2024, AllowedAreaTypes.PCON_2010]:
+        expected = [plookup.get_value(x, area_type=area_type) for x in postcodes]  # type: ignore
+        values = plookup.get_values(postcodes, area_type=area_type)  # type: ignore
+        assert values.tolist() == expected
+
+    keys = [
+        process.postcode_to_int(x) if process.check_real_postcode(x) else -1  # type: ignore
+        for x in postcodes
+    ]
+    assert process.postcodes_to_ints(postcodes).tolist() == keys  # type: ignore
+
+
+def test_postcode_membership(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Check the compressed postcode list finds every postcode in the source,
+    and rejects those that aren't
+    """
+    monkeypatch.setattr(process, "data_folder", tmp_path)
+    with pytest.raises(FileNotFoundError, match="generate-lookups"):
+        MiniPostcodeLookup().postcode_exists("W1K 3RH")
+
+    creator = generate.PostcodeMembershipCreator()
+    postcodes = creator.get_df(test=True)[creator.postcode_col]
+    generate.create_membership(postcodes, dest=tmp_path / "postcodes.bin")
+
+    membership = process.PostcodeMembership.from_data_folder()
+    keys = sorted({generate.postcode_to_int(x) for x in postcodes})
+    assert len(membership) == len(keys)
+    assert membership.decode().tolist() == keys
+
+    for position in [0, 1, 127, 128, 129, len(keys) - 1]:
+        assert membership.index_of(keys[position]) == position
+        assert membership.index_of(keys[position] + 1) is None
+
+    plookup = MiniPostcodeLookup(reject_unknown=True)
+    # some pseudo postcodes in the source (e.g. NPT) aren't valid postcodes
+    valid = postcodes[postcodes.apply(process.check_real_postcode)]  # type: ignore
+    assert plookup.postcodes_exist(valid).all()  # type: ignore
+    assert plookup.postcode_exists("W1K 3RH")
+    assert not plookup.postcode_exists("W1K 3RZ")
+    assert not plookup.postcode_exists("not a postcode")
+
+    unknown = pd.Series(["W1K 3RZ", "SW1A 9ZZ"])
+    assert not plookup.postcodes_exist(unknown).any()  # type: ignore
+
+    monkeypatch.setattr(process, "data_folder", generate.dest_folder)
+    area_type = AllowedAreaTypes.PCON_2024
+    assert plookup.get_value("W1K 3RZ", area_type=area_type) is None
+    assert plookup.get_values(unknown, area_type=area_type).isnull().all()  # type: ignore
+    assert plookup.get_value("W1K 3RH", area_type=area_type) is not None
+
+
+def test_postcode_coordinates(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Check single and batch coordinate lookups give back the stored centroids
+    """
+    monkeypatch.setattr(process, "data_folder", tmp_path)
+
+    df = pd.read_csv("data/onspd_100000.csv", usecols=["pcd"])  # type: ignore
+    rng = np.random.default_rng(0)
+    df["lat"] = rng.uniform(50, 58, len(df)).round(6)
+    df["long"] = rng.uniform(-6, 1.7, len(df)).round(6)
+    df["oseast1m"] = rng.integers(0, 700000, len(df))
+    df["osnrth1m"] = rng.integers(0, 1200000, len(df))
+    # no grid reference
+    df.loc[0, ["lat", "long", "oseast1m", "osnrth1m"]] = [99.999999, 0, np.nan, np.nan]
+
+    generate.create_membership(df["pcd"], dest=tmp_path / "postcodes.bin")
+    generate.create_coordinates(
+        df, postcode_col="pcd", dest=tmp_path / "postcode_coordinates.bin"
+    )
+
+    plookup = MiniPostcodeLookup()
+    assert plookup.get_coordinates(df["pcd"][0]) is None
+    assert plookup.get_coordinates("W1K 3RZ") is None
+    row = df.iloc[1]
+    assert plookup.get_coordinates(row["pcd"]) == (
+        row["lat"],
+        row["long"],
+        row["oseast1m"],
+        row["osnrth1m"],
+    )
+
+    series = pd.concat([df["pcd"], pd.Series(["W1K 3RZ", None])], ignore_index=True)
+    result = plookup.get_coordinates_series(series)  # type: ignore
+    assert list(result.columns) == ["latitude", "longitude", "easting", "northing"]
+    assert result.iloc[-2:].isnull().all().all()
+    assert result.iloc[0].isnull().all()
+    # pseudo postcodes (e.g. NPT) are not valid postcodes so aren't looked up
+    valid = df["pcd"].apply(process.check_real_postcode)  # type: ignore
+    valid[0] = False
+    assert np.allclose(result["latitude"][: len(df)][valid], df["lat"][valid])
+    assert np.allclose(result["longitude"][: len(df)][valid], df["long"][valid])
+    assert (result["easting"][: len(df)][valid] == df["oseast1m"][valid]).all()
+
+
+def test_nearest_postcodes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Check the grid search finds the same nearest postcode as a brute force search
+    """
+    monkeypatch.setattr(process, "data_folder", tmp_path)
+
+    df = pd.read_csv("data/onspd_100000.csv", usecols=["pcd"])  # type: ignore
+    df = df[df["pcd"].apply(process.check_real_postcode)]  # type: ignore
+    rng = np.random.default_rng(0)
+    df["lat"] = rng.uniform(51, 52, len(df)).round(6)
+    df["long"] = rng.uniform(-1, 0.5, len(df)).round(6)
+    df["oseast1m"] = 0
+    df["osnrth1m"] = 0
+    df = df.drop_duplicates("pcd")
+    df = df.assign(key=df["pcd"].apply(generate.postcode_to_int)).sort_values("key")  # type: ignore
+
+    generate.create_membership(df["pcd"], dest=tmp_path / "postcodes.bin")
+    generate.create_coordinates(
+        df, postcode_col="pcd", dest=tmp_path / "postcode_coordinates.bin"
+    )
+    coordinates = process.PostcodeCoordinates.from_data_folder()
+    generate.create_spatial_index(
+        coordinates.latitude,
+        coordinates.longitude,
+        process.PostcodeMembership.from_data_folder().decode(),
+        dest=tmp_path / "postcode_grid.bin",
+    )
+
+    points_lat = np.append(rng.uniform(51, 52, 200), [60.0, np.nan])
+    points_long = np.append(rng.uniform(-1, 0.5, 200), [0.0, 0.0])
+
+    plookup = MiniPostcodeLookup()
+    result = plookup.nearest_postcodes(points_lat, points_long)
+    # the grid holds the keys and coordinates it needs
+    assert plookup.coordinates is None and plookup.membership is None
+
+    dy = (df["lat"].to_numpy()[None, :] - points_lat[:200, None]) * 111_195
+    dx = (
+        (df["long"].to_numpy()[None, :] - points_long[:200, None])
+        * 111_195
+        * np.cos(np.radians(points_lat[:200, None]))
+    )
+    distance = np.sqrt(dx * dx + dy * dy)
+    nearest = distance.argmin(axis=1)
+    expected = df["pcd"].to_numpy()[nearest]
+    expected = [
+        f"{x.replace(' ', '')[:-3]} {x.replace(' ', '')[-3:]}" for x in expected
+    ]
+
+    assert result["postcode"][:200].tolist() == expected
+    assert np.allclose(result["distance"][:200], distance.min(axis=1), atol=1)
+    # too far away from any postcode, or not a number
+    assert result["postcode"][200:].isnull().all()
+
+    nearest_postcode = plookup.nearest_postcode(points_lat[0], points_long[0])
+    assert nearest_postcode is not None
+    assert nearest_postcode.postcode == expected[0]
+
+    # points far outside the grid are skipped rather than searched ring by ring
+    grid = process.PostcodeGrid.from_data_folder()
+    keys, _ = grid.nearest(
+        np.append(np.full(20_000, 0.0), np.full(200, 89.5)),
+        np.append(np.full(20_000, 0.0), np.full(200, 0.0)),
+    )
+    assert (keys == -1).all()
+    # anything within max_distance of the grid is still found, however far out
+    keys, distances = grid.nearest(np.array([52.05]), np.array([0.6]))
+    outside = np.sqrt(
+        ((df["lat"].to_numpy() - 52.05) * 111_195) ** 2
+        + ((df["long"].to_numpy() - 0.6) * 111_195 * np.cos(np.radians(52.05))) ** 2
+    )
+    assert keys[0] == generate.postcode_to_int(df["pcd"].to_numpy()[outside.argmin()])
+    assert np.isclose(distances[0], outside.min(), atol=1)
+
+
+def test_stream():
+    """
+    Check postcodes read from stdin get the same areas as single lookups
+    """
+    postcodes = ["SW1A 0AA", "not a postcode", "W1K 3RH"]
+    runner = CliRunner()
+    result = runner.invoke(
+        app,
+        [
+            "stream",
+            "--area-type",
+            "pcon_2024",
+            "--area-type",
+            "pcon_2010",
+            "--no-use-daemon",
+            "--batch-size",
+            "2",
+        ],
+        input="\n".join(postcodes) + "\n",
+    )
+    assert result.exit_code == 0, result.output
+
+    plookup = MiniPostcodeLookup()
+    expected = ["postcode\tpcon_2024\tpcon_2010"] + [
+        "\t".join(
+            [
+                x,
+                plookup.get_value(x, area_type=AllowedAreaTypes.PCON_2024) or "",
+                plookup.get_value(x, area_type=AllowedAreaTypes.PCON_2010) or "",
+            ]
+        )
+        for x in postcodes
+    ]
+    assert result.output.splitlines() == expected
+
+    result = runner.invoke(
+        app,
+        ["stream", "--output-format", "ndjson", "--no-use-daemon"],
+        input="SW1A 0AA\n",
+    )
+    assert json.loads(result.output) == {
+        "postcode": "SW1A 0AA",
+        "pcon_2024": plookup.get_value(
+            "SW1A 0AA", area_type=AllowedAreaTypes.PCON_2024
+        ),
+    }
+
+
+def test_daemon(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Check lookups through the socket server match local lookups
+    """
+    socket_path = tmp_path / "lookup.sock"
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=daemon.serve,
+        kwargs={"socket_path": socket_path, "ready": ready},
+        daemon=True,
+    )
+    thread.start()
+    assert ready.wait(10)
+    assert client.is_running(socket_path)
+
+    postcodes = ["SW1A 0AA", "not a postcode", "W1K 3RH"]
+    area_types = [AllowedAreaTypes.PCON_2024, AllowedAreaTypes.LOCAL_AUTHORITIES]
+    connection = client.LookupClient.connect(socket_path)
+    assert connection is not None
+    with connection:
+        values = connection.get_values(postcodes, area_types)
+        # the connection can be reused
+        assert connection.get_values(postcodes, area_types) == values
+        with pytest.raises(ValueError):
+            connection.get_values(postcodes, ["not an area"])
+
+        # other clients aren't blocked by an open connection
+        other = client.LookupClient.connect(socket_path, timeout=5)
+        assert other is not None
+        with other:
+            assert other.get_values(postcodes, area_types) == values
+
+    plookup = MiniPostcodeLookup()
+    for area_type in area_types:
+        assert values[area_type] == [
+            plookup.get_value(x, area_type=area_type) for x in postcodes
+        ]
+
+    assert client.LookupClient.connect(tmp_path / "missing.sock") is None
+    # a socket owned by someone else isn't trusted
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    assert client.LookupClient.connect(socket_path) is None
+    monkeypatch.undo()
+
+    # the command line answers get-postcode from the server without pandas
+    script = (
+        "import sys; from mini_postcode_lookup.client import main; main(); "
+        "assert 'pandas' not in sys.modules"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, "get-postcode", "W1K 3RH"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, client.SOCKET_ENV: str(socket_path)},
+        check=True,
+    )
+    assert result.stdout.strip() == values[AllowedAreaTypes.PCON_2024][2]
+
+
+def test_sqlite_function():
+    """
+    Check the SQLite function matches the python lookup
+    """
+    df = pd.read_csv("data/onspd_100000.csv", nrows=1000)  # type: ignore
+    df.loc[0, "pcd"] = "not a postcode"
+    connection = sqlite3.connect(":memory:")
+    df.to_sql("postcodes", connection, index=False)
+    sql.register_sqlite(connection)
+
+    rows = connection.execute(
+        "select pcd, postcode_area(pcd, 'pcon_2024'), postcode_key(pcd) from postcodes"
+    ).fetchall()
+
+    plookup = MiniPostcodeLookup()
+    assert [x[1] for x in rows] == [
+        plookup.get_value(x, area_type=AllowedAreaTypes.PCON_2024) for x in df["pcd"]
+    ]
+    assert [x[2] for x in rows] == process.postcodes_to_ints(df["pcd"]).tolist()
+    assert rows[0][2] == -1
+
+
+def test_duckdb_function():
+    """
+    Check the DuckDB function and an ASOF join on the range table
+    match the python lookup
+    """
+    df = pd.read_csv("data/onspd_100000.csv", nrows=5000)  # type: ignore
+    df.loc[0, "pcd"] = "not a postcode"
+    connection = duckdb.connect()
+    sql.register_duckdb(connection)
+    connection.register("postcodes", df)
+    connection.register("pcon_2024_ranges", sql.range_table(AllowedAreaTypes.PCON_2024))
+
+    plookup = MiniPostcodeLookup()
+    expected = [
+        plookup.get_value(x, area_type=AllowedAreaTypes.PCON_2024) for x in df["pcd"]
+    ]
+
+    result = connection.execute(
+        "select postcode_area(pcd, 'pcon_2024') as area from postcodes"
+    ).df()
+    assert result["area"].tolist() == expected
+
+    result = connection.execute(
+        """
+        select p.pcd, r.pcon_2024
+        from postcodes p
+        asof left join pcon_2024_ranges r
+        on postcode_key(p.pcd) >= r.postcode_key
+        """
+    ).df()
+    result = result.set_index("pcd")["pcon_2024"]
+    assert [result[x] for x in df["pcd"][1:]] == expected[1:]
+
+
+def test_verify_reports_mismatches():
+    """
+    Check verification picks up values that don't match the lookup
+    """
+    creator = generate.PCONLookupCreator()
+    df = creator.get_df(test=True)
+    df.loc[df.index[:5], creator.value_col] = "E14999999"
+
+    checked, skipped, mismatches = generate.verify_range(
+        df,
+        postcode_col=creator.postcode_col,
+        value_col=creator.value_col,
+        lookup_path=generate.dest_folder / f"{creator.slug}.json",
+    )
+    assert checked + skipped == len(df)
+    assert mismatches["postcode"].tolist() == df[creator.postcode_col][:5].tolist()
+    assert (mismatches["expected"] == "E14999999").all()
+
+
+def test_verify_shares_postcode_conversion(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Check lookups from the same source are verified from one conversion
+    of its postcodes
+    """
+    for slug in ["local_authorities", "pcon_2010"]:
+        shutil.copy(generate.dest_folder / f"{slug}.json", tmp_path / f"{slug}.json")
+    monkeypatch.setattr(generate, "dest_folder", tmp_path)
+
+    calls: list[int] = []
+    postcodes_to_ints = process.postcodes_to_ints
+
+    def counted(series: pd.Series) -> np.ndarray:  # type: ignore
+        calls.append(len(series))
+        return postcodes_to_ints(series)
+
+    monkeypatch.setattr(process, "postcodes_to_ints", counted)
+    assert generate.verify(test=True)
+    assert len(calls) == 1